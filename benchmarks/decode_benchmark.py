@@ -0,0 +1,82 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ga4_pipeline.decode import response_to_frame
+from ga4_pipeline.fake_ga4 import FakeAnalyticsDataClient
+from ga4_pipeline.fetch import build_report_request
+from ga4_pipeline.reports import REPORTS
+
+
+# The per-row decoder the reports used before the columnar one, kept here as the baseline
+def legacy_response_to_frame(response, report, property_id):
+    rows = [[dimension_value.value for dimension_value in row.dimension_values] +
+            [metric_value.value for metric_value in row.metric_values] for row in response.rows]
+
+    columns = [report.column_for(name) for name in report.dimensions + report.metrics]
+    df = pd.DataFrame(rows, columns=columns)
+    df[report.date_column] = pd.to_datetime(df[report.date_column], format='%Y%m%d')
+    for name in report.metrics:
+        column = report.column_for(name)
+        values = pd.to_numeric(df[column], errors='coerce').fillna(0)
+        df[column] = values.astype(int) if report.field_type(column) == "INTEGER" else values.astype(float)
+
+    if "Community_ID" in dict(report.schema):
+        df['Community_ID'] = property_id
+    return df
+
+
+# Function to build a synthetic response with the requested number of rows
+def synthetic_response(report, rows, days, cardinality):
+    client = FakeAnalyticsDataClient(rows_per_day=max(1, rows // days), cardinality=cardinality)
+    end_date = datetime(2024, 1, 1) + timedelta(days=days - 1)
+    request = build_report_request(report, "1", "2024-01-01", end_date.strftime('%Y-%m-%d'))
+    request.limit = rows
+    return client.run_report(request)
+
+
+def time_decoder(decoder, response, report, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = decoder(response, report, "1")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the per-row and columnar GA4 response decoders")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--cardinality', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--reports', nargs='+', choices=sorted(REPORTS), default=["WebEventData", "ga4_ad_data_pull"])
+    options = parser.parse_args(argv)
+
+    for name in options.reports:
+        report = REPORTS[name]
+        response = synthetic_response(report, options.rows, options.days, options.cardinality)
+
+        legacy_time, legacy_df = time_decoder(legacy_response_to_frame, response, report, options.repeat)
+        columnar_time, columnar_df = time_decoder(response_to_frame, response, report, options.repeat)
+
+        # Both decoders must agree on every value before the timings mean anything
+        pd.testing.assert_frame_equal(legacy_df, columnar_df, check_dtype=False, check_categorical=False)
+
+        legacy_memory = legacy_df.memory_usage(deep=True).sum() / 1e6
+        columnar_memory = columnar_df.memory_usage(deep=True).sum() / 1e6
+        print(f"{name}: {len(response.rows)} rows")
+        print(f"  per-row:  {legacy_time:.3f}s  {len(response.rows) / legacy_time:,.0f} rows/s  {legacy_memory:.1f} MB")
+        print(f"  columnar: {columnar_time:.3f}s  {len(response.rows) / columnar_time:,.0f} rows/s  {columnar_memory:.1f} MB")
+        print(f"  speedup:  {legacy_time / columnar_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ga4_pipeline.cli import build_parser
+from ga4_pipeline.fake_bigquery import FakeBigQueryClient
+from ga4_pipeline.fake_ga4 import FakeAnalyticsDataClient
+from ga4_pipeline.fetch import ThrottledAnalyticsClient
+from ga4_pipeline.metrics import InstrumentedAnalyticsClient, RunMetrics
+from ga4_pipeline.reports import REPORTS
+from ga4_pipeline.runner import run
+
+# Stages shown in the results table, in pipeline order
+STAGES = ("ga4_request", "decode", "spool", "cache_write", "load_job", "merge")
+
+
+# Function to build a community map with the requested number of properties
+def synthetic_communities(properties):
+    return {f"Benchmark Community {i}": str(100000000 + i) for i in range(properties)}
+
+
+# Function to run the real pipeline once against the in-process fakes and summarise it
+# Runs in its own process so peak RSS belongs to this scenario alone
+def run_scenario(properties, options):
+    metrics = RunMetrics()
+    ga_client = FakeAnalyticsDataClient(rows_per_day=options.rows_per_day, cardinality=options.cardinality,
+                                        latency=options.latency)
+    ga_client = ThrottledAnalyticsClient(InstrumentedAnalyticsClient(ga_client, metrics))
+    reports = [REPORTS[name] for name in options.reports]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Keep the fake warehouse on disk so peak RSS measures the pipeline, not the rows it loaded
+        bq_client = FakeBigQueryClient(database=os.path.join(work_dir, 'bigquery.sqlite'))
+        pipeline_options = build_parser().parse_args([
+            '--state-path', os.path.join(work_dir, 'state.json'),
+            '--cache-path', os.path.join(work_dir, 'cache.sqlite'),
+            '--journal-path', os.path.join(work_dir, 'journal.json'),
+            '--start-date', options.start_date,
+            '--end-date', options.end_date,
+            '--max-workers', str(options.max_workers),
+        ] + ([] if options.cache else ['--no-cache']))
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(reports, ga_client, bq_client, synthetic_communities(properties), pipeline_options, metrics=metrics)
+        bq_client.conn.close()
+
+    summary = metrics.summary()
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / 1e6 if sys.platform == 'darwin' else peak_rss / 1e3
+    # Retries and compaction are counted too; only loaded rows measure throughput
+    rows = sum(count for name, count in summary["counters"].items() if name.startswith("rows_loaded:"))
+    return {
+        "properties": properties,
+        "rows": rows,
+        "seconds": summary["wall_seconds"],
+        "rows_per_second": rows / summary["wall_seconds"],
+        "peak_rss_mb": peak_rss_mb,
+        "ga4_requests": summary["stages"]["ga4_request"]["calls"],
+        "stages": {name: totals["seconds"] for name, totals in summary["stages"].items()},
+    }
+
+
+def build_benchmark_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the full pipeline against fake GA4 and BigQuery clients")
+    parser.add_argument('--properties', type=int, nargs='+', default=[1, 12, 200])
+    parser.add_argument('--rows-per-day', type=int, default=20)
+    parser.add_argument('--cardinality', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds each fake GA4 call blocks, to model network latency")
+    parser.add_argument('--start-date', default="2024-01-01")
+    parser.add_argument('--end-date', default="2024-01-31")
+    parser.add_argument('--max-workers', type=int, default=6)
+    parser.add_argument('--reports', nargs='+', choices=sorted(REPORTS), default=list(REPORTS))
+    parser.add_argument('--cache', action='store_true', help="Run with the response cache enabled")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--scenario', type=int, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options = build_benchmark_parser().parse_args(argv)
+
+    if options.scenario is not None:
+        print(json.dumps(run_scenario(options.scenario, options)))
+        return
+
+    results = []
+    for properties in options.properties:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', str(properties)] + argv,
+                               check=True, capture_output=True, text=True)
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    # Stage times are summed across fetch threads, so they can add up to more than the wall time
+    print(f"{'properties':>10} {'rows':>9} {'seconds':>8} {'rows/s':>9} {'peak MB':>8} {'requests':>8}  "
+          + " ".join(f"{stage:>11}" for stage in STAGES))
+    for result in results:
+        print(f"{result['properties']:>10} {result['rows']:>9} {result['seconds']:>8.2f} "
+              f"{result['rows_per_second']:>9,.0f} {result['peak_rss_mb']:>8.0f} {result['ga4_requests']:>8}  "
+              + " ".join(f"{result['stages'].get(stage, 0):>11.2f}" for stage in STAGES))
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+# Pipeline that pulls GA4 reports for the configured communities into BigQuery
+from .reports import REPORTS, ReportDefinition
@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+
+from .loader import arrow_schema, frame_to_arrow
+
+# Default location of the on-disk response cache
+DEFAULT_CACHE_PATH = 'ga4_cache.sqlite'
+
+# GA4 keeps revising a day for about this long; a day fetched after that is never fetched again
+DEFAULT_SETTLED_DAYS = 3
+
+# How long a day that was still settling when it was fetched may be served from the cache
+DEFAULT_TTL_HOURS = 6
+
+# Size cap for the cache; least recently used days are evicted beyond it
+DEFAULT_MAX_MB = 1024
+
+
+# Function to list the ISO dates from start_date to end_date inclusive
+def days_between(start_date, end_date):
+    start = date.fromisoformat(start_date)
+    return [(start + timedelta(days=i)).isoformat() for i in range((date.fromisoformat(end_date) - start).days + 1)]
+
+
+# Function to serialise an Arrow table for storage
+def _to_bytes(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# On-disk cache of decoded report rows keyed by (property, report fingerprint, day)
+# Pages are stored as pending parts while a fetch runs and only become visible once the whole
+# fetch window completes, so a failed fetch never leaves a partially cached day behind
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_hours=DEFAULT_TTL_HOURS, max_mb=DEFAULT_MAX_MB,
+                 settled_days=DEFAULT_SETTLED_DAYS, clock=time.time):
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.settled_days = settled_days
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS days (
+                key TEXT, day TEXT, fetch_id TEXT, fetched_at REAL, accessed_at REAL, size INTEGER,
+                PRIMARY KEY (key, day)
+            );
+            CREATE TABLE IF NOT EXISTS parts (
+                key TEXT, day TEXT, fetch_id TEXT, data BLOB
+            );
+            CREATE INDEX IF NOT EXISTS parts_by_day ON parts (key, day, fetch_id);
+            CREATE INDEX IF NOT EXISTS days_by_access ON days (accessed_at);
+        """)
+
+    # Function to build the cache key for a report on a property
+    @staticmethod
+    def key(report, property_id):
+        return f"{property_id}:{report.fingerprint()}"
+
+    # A day is fresh if it had already settled when it was fetched, or if it was fetched within the TTL
+    def _is_fresh(self, day, fetched_at, now):
+        settled_at = datetime.fromisoformat(day) + timedelta(days=self.settled_days + 1)
+        if fetched_at >= settled_at.timestamp():
+            return True
+        return now - fetched_at < self.ttl_seconds
+
+    # Function to find the smallest date range that still has to be fetched from GA4
+    # Returns (start_date, end_date), or None when every day can be served from the cache
+    def fetch_window(self, key, start_date, end_date):
+        now = self.clock()
+        with self.lock:
+            cached = dict(self.conn.execute(
+                "SELECT day, fetched_at FROM days WHERE key = ? AND day BETWEEN ? AND ?",
+                (key, start_date, end_date)))
+
+        missing = [day for day in days_between(start_date, end_date)
+                   if day not in cached or not self._is_fresh(day, cached[day], now)]
+        if not missing:
+            return None
+        return missing[0], missing[-1]
+
+    # Function to read the cached rows for every day in a range as one Arrow table, or None
+    def read(self, key, start_date, end_date):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT parts.data FROM parts JOIN days ON parts.key = days.key AND parts.day = days.day "
+                "AND parts.fetch_id = days.fetch_id WHERE days.key = ? AND days.day BETWEEN ? AND ? "
+                "ORDER BY days.day", (key, start_date, end_date)).fetchall()
+            self.conn.execute("UPDATE days SET accessed_at = ? WHERE key = ? AND day BETWEEN ? AND ?",
+                              (self.clock(), key, start_date, end_date))
+        if not rows:
+            return None
+        return pa.concat_tables([pa.ipc.open_stream(data).read_all() for (data,) in rows])
+
+    # Function to store one decoded page as pending parts, split by day
+    def put(self, key, fetch_id, df, report):
+        if df.empty:
+            return
+
+        # Sort the page by day once so each day's rows are one contiguous slice
+        days, codes = np.unique(df[report.date_column].to_numpy().astype('datetime64[D]'), return_inverse=True)
+        order = np.argsort(codes, kind='stable')
+        table = frame_to_arrow(df, arrow_schema(report.schema)).take(order)
+        bounds = np.searchsorted(codes[order], np.arange(len(days) + 1))
+        parts = [(key, str(day), fetch_id, _to_bytes(table.slice(bounds[i], bounds[i + 1] - bounds[i])))
+                 for i, day in enumerate(days)]
+        with self.lock:
+            self.conn.executemany("INSERT INTO parts (key, day, fetch_id, data) VALUES (?, ?, ?, ?)", parts)
+
+    # Function to publish a finished fetch: every day of the window, including days with no rows,
+    # now points at this fetch's parts and the parts of older fetches are dropped
+    def complete(self, key, fetch_id, start_date, end_date):
+        now = self.clock()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            sizes = dict(self.conn.execute(
+                "SELECT day, SUM(LENGTH(data)) FROM parts WHERE key = ? AND fetch_id = ? GROUP BY day",
+                (key, fetch_id)))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO days (key, day, fetch_id, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, day, fetch_id, now, now, sizes.get(day, 0)) for day in days_between(start_date, end_date)])
+            self.conn.execute("DELETE FROM parts WHERE key = ? AND day BETWEEN ? AND ? AND fetch_id != ?",
+                              (key, start_date, end_date, fetch_id))
+            self.conn.execute("COMMIT")
+
+    # Function to drop the pending parts of a fetch that did not finish
+    def discard(self, key, fetch_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM parts WHERE key = ? AND fetch_id = ?", (key, fetch_id))
+
+    # Function to evict least recently used days until the cache fits under its size cap
+    def evict(self):
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM days").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            evicted = 0
+            self.conn.execute("BEGIN")
+            for key, day, size in self.conn.execute(
+                    "SELECT key, day, size FROM days ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM parts WHERE key = ? AND day = ?", (key, day))
+                self.conn.execute("DELETE FROM days WHERE key = ? AND day = ?", (key, day))
+                total -= size
+                evicted += 1
+            self.conn.execute("COMMIT")
+        print(f"Evicted {evicted} cached days to stay under {self.max_bytes // (1024 * 1024)} MB.")
+        return evicted
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Function to add the response cache options to the CLI
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH,
+                        help="Path of the on-disk GA4 response cache")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always fetch from GA4 and leave the response cache untouched")
+    parser.add_argument('--cache-ttl-hours', type=float, default=DEFAULT_TTL_HOURS,
+                        help="How long days still inside GA4's processing window are served from the cache")
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_MB,
+                        help="Size cap of the response cache; least recently used days are evicted beyond it")
+    return parser
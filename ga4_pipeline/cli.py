@@ -0,0 +1,90 @@
+import argparse
+import sys
+
+from .config import BQ_KEY_PATH, COMMUNITIES, GA_KEY_PATH
+from .reports import REPORTS
+from .validate import validate_main
+
+
+# Function to build the command line parser for the pipeline
+# Modules with heavy dependencies (pandas, pyarrow, the Google clients) are imported here and in
+# main rather than at the top, so `validate` and plain imports of this module stay fast
+def build_parser():
+    from .cache import add_cache_arguments
+    from .compaction import add_compaction_arguments
+    from .fetch import add_fetch_arguments
+    from .journal import add_journal_arguments
+    from .loader import add_loader_arguments
+    from .metrics import add_metrics_arguments
+    from .retry import add_retry_arguments
+    from .rollups import add_rollup_arguments
+    from .scheduler import add_scheduler_arguments
+    from .shards import add_shard_arguments
+    from .state import add_sync_arguments
+
+    parser = argparse.ArgumentParser(prog="ga4_pipeline", description="Pull GA4 reports into BigQuery")
+    parser.add_argument('--reports', nargs='+', choices=sorted(REPORTS), default=list(REPORTS),
+                        help="Reports to run (default: all)")
+    parser.add_argument('--ga-key-path', default=GA_KEY_PATH,
+                        help="Service account key for Google Analytics")
+    parser.add_argument('--bq-key-path', default=BQ_KEY_PATH,
+                        help="Service account key for BigQuery (falls back to the GA key)")
+    parser.add_argument('--export-dir',
+                        help="Also keep each run's Parquet files under this directory as an offline export")
+    parser.add_argument('--replay', metavar='EXPORT_DIR',
+                        help="Load the Parquet exports under EXPORT_DIR into BigQuery instead of fetching from GA4")
+    add_sync_arguments(parser)
+    add_fetch_arguments(parser)
+    add_shard_arguments(parser)
+    add_retry_arguments(parser)
+    add_loader_arguments(parser)
+    add_journal_arguments(parser)
+    add_compaction_arguments(parser)
+    add_rollup_arguments(parser)
+    add_scheduler_arguments(parser)
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser
+
+
+# Entry point of the CLI; returns the process exit code, 1 when any shard could not be loaded
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['validate']:
+        return validate_main(argv[1:])
+
+    options = build_parser().parse_args(argv)
+    from .clients import build_clients
+    from .fetch import ThrottledAnalyticsClient
+    from .metrics import InstrumentedAnalyticsClient, RunMetrics
+    from .retry import RetryPolicy
+    from .runner import replay, run
+    from .scheduler import Scheduler, build_jobs, parse_cadence
+
+    metrics = RunMetrics()
+
+    ga_client, bq_client = build_clients(options.ga_key_path, options.bq_key_path)
+
+    reports = [REPORTS[name] for name in options.reports]
+    failed = []
+    try:
+        if options.replay:
+            replay(reports, bq_client, options.replay, metrics=metrics)
+        elif options.schedule:
+            # One warm set of clients and throttles serves every job for the life of the daemon;
+            # the scheduler instruments each job's GA4 calls into that job's own run report
+            jobs = build_jobs(reports, intraday_reports=options.intraday_reports,
+                              cadences=dict(parse_cadence(value) for value in options.cadence))
+            Scheduler(jobs, ga_client, bq_client, COMMUNITIES, options, metrics=metrics, max_jobs=options.max_jobs,
+                      poll_seconds=options.poll_seconds, quota_floor=options.quota_floor).run_forever()
+        else:
+            # Time GA4 calls inside the throttle so the stage timings measure GA4, not our own pacing
+            ga_client = ThrottledAnalyticsClient(InstrumentedAnalyticsClient(ga_client, metrics),
+                                                 requests_per_second=options.requests_per_second,
+                                                 burst=options.burst, retry=RetryPolicy.from_options(options, metrics))
+            failed = run(reports, ga_client, bq_client, COMMUNITIES, options, metrics=metrics)
+    finally:
+        # Write the run report even when the run fails, so a broken night still shows where it stopped
+        metrics.write(options.run_report_path, options.openmetrics_path)
+    # A partial run exits non-zero so cron and alerting can tell it from a complete one
+    return 1 if failed else 0
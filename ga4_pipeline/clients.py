@@ -0,0 +1,141 @@
+import os
+
+from google.analytics.data_v1beta import BetaAnalyticsDataClient
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from google.oauth2 import service_account
+
+from .config import DATASET_LOCATION, DATASET_NAME
+
+# GoogleSQL names of the schema field types whose legacy names CAST does not accept
+SQL_TYPES = {"INTEGER": "INT64", "FLOAT": "FLOAT64", "BOOLEAN": "BOOL"}
+
+
+# Function to authenticate the GA4 client on its own, for commands that never touch BigQuery
+def build_analytics_client(ga_key_path):
+    ga_credentials = service_account.Credentials.from_service_account_file(ga_key_path)
+    return BetaAnalyticsDataClient(credentials=ga_credentials), ga_credentials
+
+
+# Function to authenticate both clients once per run
+# BigQuery uses its own key when one is present, otherwise the GA4 key's project
+def build_clients(ga_key_path, bq_key_path):
+    ga_client, ga_credentials = build_analytics_client(ga_key_path)
+
+    if os.path.exists(bq_key_path):
+        bq_credentials = service_account.Credentials.from_service_account_file(bq_key_path)
+    else:
+        bq_credentials = ga_credentials
+    bq_client = bigquery.Client(credentials=bq_credentials, project=bq_credentials.project_id)
+
+    return ga_client, bq_client
+
+
+# Function to ensure the 'combined' dataset exists, creating it if it does not
+def ensure_dataset(bq_client, project_id):
+    dataset_id = f"{project_id}.{DATASET_NAME}"
+    try:
+        bq_client.get_dataset(dataset_id)  # Make an API request.
+    except Exception as e:
+        dataset = bigquery.Dataset(dataset_id)
+        dataset.location = DATASET_LOCATION
+        bq_client.create_dataset(dataset, timeout=30)  # Make an API request.
+        print(f"Created dataset {dataset_id}")
+    return dataset_id
+
+
+# Function to build the BigQuery schema declared by a report
+def report_schema(report):
+    return [bigquery.SchemaField(name, field_type) for name, field_type in report.schema]
+
+
+# Function to build the day partitioning and clustering a report's table should have
+def table_layout(report):
+    time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field=report.date_column)
+    return time_partitioning, list(report.cluster_columns) or None
+
+
+# Function to tell whether an existing table is already partitioned by day on the report's date column
+def has_partitioning(table, report):
+    time_partitioning, _ = table_layout(report)
+    return (table.time_partitioning is not None
+            and table.time_partitioning.type_ == time_partitioning.type_
+            and table.time_partitioning.field == time_partitioning.field)
+
+
+# Function to create a report's target table if it does not exist yet, partitioned by day on the
+# report's date column and clustered on its cluster columns; an existing table without that layout is migrated
+def ensure_table(bq_client, report, dataset_id):
+    table_id = report.table_id(dataset_id)
+    migration_table_id = f"{table_id}_migration"
+    try:
+        table = bq_client.get_table(table_id)
+    except NotFound:
+        table = None
+
+    if table is None and _exists(bq_client, migration_table_id):
+        # A migration stopped after dropping the old table; its rows are all in the migration table
+        _finish_migration(bq_client, migration_table_id, table_id)
+    elif table is None:
+        table = bigquery.Table(table_id, schema=report_schema(report))
+        table.time_partitioning, table.clustering_fields = table_layout(report)
+        bq_client.create_table(table, exists_ok=True)
+    else:
+        table = add_missing_columns(bq_client, report, table)
+        _, clustering_fields = table_layout(report)
+        if not has_partitioning(table, report):
+            migrate_table(bq_client, report, table_id, migration_table_id)
+        elif (table.clustering_fields or None) != clustering_fields:
+            # Clustering can be changed in place; rows written from now on use the new columns
+            table.clustering_fields = clustering_fields
+            bq_client.update_table(table, ["clustering_fields"])
+            print(f"Clustered {table_id} on {', '.join(report.cluster_columns)}.")
+    print(f"Ensured table {table_id}.")
+    return table_id
+
+
+# Function to add the report columns an existing table lacks; old rows read them as NULL
+def add_missing_columns(bq_client, report, table):
+    existing = {field.name for field in table.schema}
+    missing = [field for field in report_schema(report) if field.name not in existing]
+    if not missing:
+        return table
+    table.schema = list(table.schema) + missing
+    print(f"Adding columns {', '.join(field.name for field in missing)} to {report.table_name}.")
+    return bq_client.update_table(table, ["schema"])
+
+
+def _exists(bq_client, table_id):
+    try:
+        bq_client.get_table(table_id)
+        return True
+    except NotFound:
+        return False
+
+
+# Function to move an existing table's rows into a partitioned and clustered table of the same name
+# BigQuery cannot change a table's partitioning in place, so the rows are copied into a new table,
+# the old table is dropped and the new one is copied back under the original name
+def migrate_table(bq_client, report, table_id, migration_table_id):
+    print(f"Migrating {table_id} to day partitions on {report.date_column}, "
+          f"clustered on {', '.join(report.cluster_columns)}.")
+    bq_client.delete_table(migration_table_id, not_found_ok=True)
+    migration_table = bigquery.Table(migration_table_id, schema=report_schema(report))
+    migration_table.time_partitioning, migration_table.clustering_fields = table_layout(report)
+    bq_client.create_table(migration_table)
+
+    # Tables written by load_table_from_dataframe may type a column differently, e.g. Date as DATETIME,
+    # and BigQuery does not convert types on INSERT, so every column is cast to its declared type
+    columns = ", ".join(name for name, _ in report.schema)
+    casts = ", ".join(f"CAST({name} AS {SQL_TYPES.get(field_type, field_type)}) AS {name}"
+                      for name, field_type in report.schema)
+    bq_client.query(f"INSERT INTO `{migration_table_id}` ({columns}) SELECT {casts} FROM `{table_id}`").result()
+    bq_client.delete_table(table_id)
+    _finish_migration(bq_client, migration_table_id, table_id)
+
+
+# Function to copy the migration table to the target name and drop it; copy jobs keep the layout and scan nothing
+def _finish_migration(bq_client, migration_table_id, table_id):
+    bq_client.copy_table(migration_table_id, table_id).result()
+    bq_client.delete_table(migration_table_id)
+    print(f"Migrated {table_id}.")
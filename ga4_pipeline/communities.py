@@ -0,0 +1,63 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from .config import COMMUNITY_TABLE_NAME
+from .loader import arrow_schema, frame_to_arrow
+
+# Columns of the community dimension table
+COMMUNITY_SCHEMA = (
+    ("Community_ID", "STRING"),
+    ("Community_Name", "STRING"),
+)
+
+
+# Function to index the community map by property, listing every community that shares each property
+# Reports are fetched once per property; communities are attributed in BigQuery through the dimension table
+def property_index(communities):
+    index = {}
+    for community_name, property_id in sorted(communities.items()):
+        index.setdefault(property_id, []).append(community_name)
+    return index
+
+
+# Function to replace the community dimension table with the current community map
+# The table is a handful of rows, so it is rewritten in one truncating load job every run
+def sync_communities(bq_client, dataset_id, communities):
+    table_id = f"{dataset_id}.{COMMUNITY_TABLE_NAME}"
+    schema = [bigquery.SchemaField(name, field_type) for name, field_type in COMMUNITY_SCHEMA]
+    df = pd.DataFrame(
+        [(property_id, community_name) for community_name, property_id in sorted(communities.items())],
+        columns=[name for name, _ in COMMUNITY_SCHEMA],
+    )
+
+    buffer = io.BytesIO()
+    pq.write_table(frame_to_arrow(df, arrow_schema(COMMUNITY_SCHEMA)), buffer)
+    buffer.seek(0)
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition="WRITE_TRUNCATE",
+        schema=schema,
+    )
+    bq_client.load_table_from_file(buffer, table_id, job_config=job_config).result()
+    print(f"Synced {len(df)} communities for {df['Community_ID'].nunique()} properties into {table_id}.")
+    return table_id
+
+
+# Function to create or refresh the view that attributes a report's rows to every community on its property
+# Only reports keyed by Community_ID can be joined to the dimension table
+def ensure_community_view(bq_client, report, dataset_id):
+    if report.key_column != "Community_ID":
+        return None
+
+    view_id = f"{dataset_id}.{report.table_name}_by_community"
+    columns = ", ".join(f"r.{name}" for name, _ in report.schema)
+    bq_client.query(
+        f"CREATE OR REPLACE VIEW `{view_id}` AS "
+        f"SELECT c.Community_Name, {columns} FROM `{report.table_id(dataset_id)}` AS r "
+        f"JOIN `{dataset_id}.{COMMUNITY_TABLE_NAME}` AS c ON r.Community_ID = c.Community_ID"
+    ).result()
+    print(f"Ensured view {view_id}.")
+    return view_id
@@ -0,0 +1,55 @@
+from .metrics import RunMetrics
+from .retry import RetryPolicy
+
+
+# Function to count the rows in a table
+def count_rows(bq_client, table_id):
+    rows = bq_client.query(f"SELECT COUNT(*) AS row_count FROM `{table_id}`").result()
+    return next(iter(rows))["row_count"]
+
+
+# Function to remove duplicate rows from a report table, keeping one row per key, date and dimensions
+# Tables that were appended to on every run hold the same day many times over; GA4 figures only grow
+# as late data arrives, so the copy with the largest metrics is the one kept. The table is rewritten
+# in one transaction, so readers see either the old rows or the compacted ones.
+# Rows loaded before the table had a key cannot be told apart by property, so of those only exact
+# copies are merged; the refresh of their days later replaces them with keyed rows
+def compact_table(bq_client, report, table_id, metrics=None, retry=None):
+    metrics = metrics or RunMetrics()
+    retry = retry or RetryPolicy()
+    columns = ", ".join(name for name, _ in report.schema)
+    partition = ", ".join(report.row_key_columns())
+    order = ", ".join(f"{report.column_for(name)} DESC" for name in report.metrics)
+    compacted = (f"SELECT {columns} FROM ("
+                 f"SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {order}) AS _row "
+                 f"FROM `{table_id}`")
+    if report.key_column:
+        compacted += (f" WHERE {report.key_column} IS NOT NULL) WHERE _row = 1 UNION ALL "
+                      f"SELECT DISTINCT {columns} FROM `{table_id}` WHERE {report.key_column} IS NULL")
+    else:
+        compacted += ") WHERE _row = 1"
+    statements = [
+        "BEGIN TRANSACTION;",
+        f"CREATE TEMP TABLE _compacted AS {compacted};",
+        f"DELETE FROM `{table_id}` WHERE TRUE;",
+        f"INSERT INTO `{table_id}` ({columns}) SELECT {columns} FROM _compacted;",
+        "COMMIT TRANSACTION;",
+        "DROP TABLE _compacted;",
+    ]
+
+    with metrics.stage("compaction") as stage:
+        before = count_rows(bq_client, table_id)
+        retry.call(lambda: bq_client.query("\n".join(statements)).result(),
+                   description=f"compaction of {table_id}")
+        after = count_rows(bq_client, table_id)
+        stage.rows = before - after
+    metrics.count(f"rows_compacted:{report.table_name}", before - after)
+    print(f"Compacted {table_id}: removed {before - after} duplicate rows, {after} left.")
+    return before - after
+
+
+# Function to add the compaction option to the CLI
+def add_compaction_arguments(parser):
+    parser.add_argument('--compact', action='store_true',
+                        help="Before fetching, remove duplicate rows already in the selected report tables")
+    return parser
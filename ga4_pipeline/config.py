@@ -0,0 +1,46 @@
+# Define the GA4 property IDs for the communities
+# Several communities share one property; each property is only ever fetched once per report and
+# its rows are attributed to every community on it through the community dimension table
+COMMUNITIES = {
+    "Astoria Senior Living - Oakdale": "425639557",
+    "Astoria Senior Living - Omaha": "425639557",
+    "Astoria Senior Living - Tracy": "425639557",
+    "CountryHouse - Cedar Rapids": "435942576",
+    "CountryHouse - Council Bluffs": "435942576",
+    "CountryHouse - Cumberland": "435942576",
+    "CountryHouse - Dickinson": "435942576",
+    "CountryHouse - Elkhorn": "435942576",
+    "CountryHouse - Folsom CA": "435942576",
+    "CountryHouse - Grand Island": "435942576",
+    "CountryHouse - Granite Bay": "435942576",
+    "CountryHouse - Kearney": "435942576",
+    "CountryHouse - Omaha": "435942576",
+    "CountryHouse Lincoln - 70th and O": "435942576",
+    "CountryHouse Lincoln - Old Cheney": "435942576",
+    "CountryHouse Lincoln - Pine Lake": "435942576",
+    "Evergreen - Dickinson": "425556002",
+    "Holland Farms": "425702360",
+    "Kingston Bay Senior Living": "425660587",
+    "Sage Glendale": "425578596",
+    "Sage Mountain": "425578596",
+    "Serra Sol": "425709023",
+    "Sunol Creek Memory Care": "441750995",
+    "Symphony Pointe": "425732958",
+    "The Kensington - Cumberland": "425556002",
+    "The Kensington - Fort Madison": "425556002",
+    "The Kensington - Hastings": "425556002",
+    "The Terrace at Via Verde": "434302697",
+    "TreVista - Concord": "425698056",
+    "TreVista-Antioch Senior Living": "425698056"
+}
+
+# Define the paths to the service account keys; BigQuery falls back to the GA key if bq_keys.json is absent
+GA_KEY_PATH = 'ga_keys.json'
+BQ_KEY_PATH = 'bq_keys.json'
+
+# BigQuery dataset every report is loaded into
+DATASET_NAME = "combined"
+DATASET_LOCATION = "US"
+
+# Dimension table holding the community map, rewritten from COMMUNITIES every run
+COMMUNITY_TABLE_NAME = "Communities"
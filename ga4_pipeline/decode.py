@@ -0,0 +1,76 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from google.analytics.data_v1beta.types import MetricType
+
+# GA4 metric types that decode to integers; floats, seconds and currency decode to floats
+INTEGER_METRIC_TYPES = {MetricType.TYPE_INTEGER}
+
+
+# Function to flatten every row's dimension values into one (rows x width) array of strings
+# Reads the raw protobuf rows directly so no proto-plus wrapper is built per row
+def _dimension_matrix(pb_rows, width):
+    flat = [value.value for row in pb_rows for value in row.dimension_values]
+    return np.array(flat, dtype=object).reshape(len(pb_rows), width)
+
+
+# Function to parse every metric value of a page into one (rows x width) float matrix
+# All values are joined and parsed by numpy's C parser in a single call
+def _metric_matrix(pb_rows, width):
+    flat = [value.value for row in pb_rows for value in row.metric_values]
+    shape = (len(pb_rows), width)
+    if not flat:
+        return np.zeros(shape, dtype=np.float64)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        values = np.fromstring(' '.join(flat), dtype=np.float64, sep=' ')
+    if values.size != len(flat):
+        # Fall back to a lenient parse when GA4 returns something that is not a plain number
+        values = pd.to_numeric(pd.Series(flat), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    return values.reshape(shape)
+
+
+# Function to parse the GA4 date dimension, converting each distinct day only once per page
+def _parse_dates(strings):
+    codes, uniques = pd.factorize(strings)
+    return pd.to_datetime(uniques, format='%Y%m%d').take(codes)
+
+
+# Function to convert one page of a report into a DataFrame laid out like the report's table
+def response_to_frame(response, report, property_id):
+    pb = type(response).pb(response)
+    row_count = len(pb.rows)
+
+    dimension_values = _dimension_matrix(pb.rows, len(report.dimensions))
+    metric_values = _metric_matrix(pb.rows, len(report.metrics))
+
+    # GA4 reports each metric's type in the headers; fall back to the table schema without them
+    metric_types = [header.type_ for header in pb.metric_headers]
+    if len(metric_types) != len(report.metrics):
+        metric_types = [None] * len(report.metrics)
+
+    columns = {}
+    for index, name in enumerate(report.dimensions):
+        column = report.column_for(name)
+        if column == report.date_column:
+            columns[column] = _parse_dates(dimension_values[:, index])
+        else:
+            # Dimensions such as eventName and campaign names repeat heavily, so store them as categoricals
+            columns[column] = pd.Categorical(dimension_values[:, index])
+
+    for index, name in enumerate(report.metrics):
+        column = report.column_for(name)
+        values = metric_values[:, index]
+        if metric_types[index] in INTEGER_METRIC_TYPES:
+            values = np.rint(values)
+        columns[column] = values.astype(np.int64) if report.field_type(column) == "INTEGER" else values
+
+    df = pd.DataFrame(columns, index=pd.RangeIndex(row_count))
+
+    # Tag the rows with their property; community names are joined on in BigQuery
+    if "Community_ID" in dict(report.schema):
+        df['Community_ID'] = property_id
+
+    return df
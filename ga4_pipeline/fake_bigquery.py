@@ -0,0 +1,225 @@
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import pyarrow.parquet as pq
+from google.api_core.exceptions import Conflict, NotFound
+from google.cloud import bigquery
+
+# SQLite column affinity for each BigQuery field type; anything else is stored as text
+SQLITE_TYPES = {
+    "INTEGER": "INTEGER",
+    "INT64": "INTEGER",
+    "FLOAT": "REAL",
+    "FLOAT64": "REAL",
+    "NUMERIC": "REAL",
+    "BOOLEAN": "INTEGER",
+}
+
+
+# BigQuery's DATE_TRUNC for the ISOWEEK (Monday) and MONTH parts, on ISO date strings
+def _date_trunc(value, part):
+    if value is None:
+        return None
+    day = date.fromisoformat(value[:10])
+    if part == 'ISOWEEK':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return day.replace(day=1).isoformat()
+
+
+# BigQuery's CAST for the types the migration casts to; SQLite's own CAST would read DATE and STRING as numbers
+def _cast(value, field_type):
+    if value is None:
+        return None
+    if field_type == 'INT64':
+        return int(value)
+    if field_type == 'FLOAT64':
+        return float(value)
+    if field_type == 'BOOL':
+        return int(bool(value))
+    if field_type == 'DATE':
+        return str(value)[:10]
+    return str(value)
+
+
+# BigQuery's SAFE_DIVIDE: NULL instead of an error when dividing by zero
+def _safe_divide(numerator, denominator):
+    if numerator is None or not denominator:
+        return None
+    return numerator / denominator
+
+
+class FakeQueryJob:
+    def __init__(self, rows):
+        self.rows = rows
+
+    # BigQuery returns a RowIterator, which can be iterated but not indexed or measured
+    def result(self):
+        return iter(self.rows)
+
+
+class FakeLoadJob:
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+
+    def result(self):
+        return self
+
+
+# Local stand-in for bigquery.Client backed by a SQLite database, in memory unless a path is given
+# Tables are named by their full BigQuery ID, so the loader's SQL runs unchanged
+class FakeBigQueryClient:
+    def __init__(self, project="fake-project", database=':memory:'):
+        self.project = project
+        self.conn = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("DATE_TRUNC", 2, _date_trunc, deterministic=True)
+        self.conn.create_function("SAFE_DIVIDE", 2, _safe_divide, deterministic=True)
+        self.conn.create_function("BQ_CAST", 2, _cast, deterministic=True)
+        self.datasets = set()
+        self.schemas = {}
+        self.layouts = {}
+        self.queries = []
+        self.load_jobs = []
+        self.lock = threading.RLock()
+
+    def get_dataset(self, dataset_id):
+        if str(dataset_id) not in self.datasets:
+            raise NotFound(f"Dataset {dataset_id} not found")
+        return bigquery.Dataset(dataset_id)
+
+    def create_dataset(self, dataset, timeout=None, exists_ok=False):
+        dataset_id = f"{dataset.project}.{dataset.dataset_id}"
+        if dataset_id in self.datasets and not exists_ok:
+            raise Conflict(f"Dataset {dataset_id} already exists")
+        self.datasets.add(dataset_id)
+        return dataset
+
+    def _table_id(self, table):
+        if isinstance(table, str):
+            return table
+        return f"{table.project}.{table.dataset_id}.{table.table_id}"
+
+    # Partitioning and clustering are only recorded; SQLite stores every table the same way
+    def _create(self, table_id, schema, time_partitioning=None, clustering_fields=None):
+        columns = ", ".join(f'"{field.name}" {SQLITE_TYPES.get(field.field_type, "TEXT")}' for field in schema)
+        self.conn.execute(f'CREATE TABLE "{table_id}" ({columns})')
+        self.schemas[table_id] = list(schema)
+        self.layouts[table_id] = (time_partitioning, clustering_fields)
+
+    def create_table(self, table, exists_ok=False):
+        table_id = self._table_id(table)
+        with self.lock:
+            if table_id in self.schemas:
+                if not exists_ok:
+                    raise Conflict(f"Table {table_id} already exists")
+                return self.get_table(table_id)
+            self._create(table_id, table.schema, table.time_partitioning, table.clustering_fields)
+        return self.get_table(table_id)
+
+    def get_table(self, table):
+        table_id = self._table_id(table)
+        if table_id not in self.schemas:
+            raise NotFound(f"Table {table_id} not found")
+        table = bigquery.Table(table_id, schema=self.schemas[table_id])
+        table.time_partitioning, table.clustering_fields = self.layouts[table_id]
+        return table
+
+    def delete_table(self, table, not_found_ok=False):
+        table_id = self._table_id(table)
+        with self.lock:
+            if table_id not in self.schemas:
+                if not not_found_ok:
+                    raise NotFound(f"Table {table_id} not found")
+                return
+            self.conn.execute(f'DROP TABLE "{table_id}"')
+            del self.schemas[table_id]
+            del self.layouts[table_id]
+
+    # Apply schema additions and clustering changes, the two table updates BigQuery allows in place
+    def update_table(self, table, fields):
+        table_id = self._table_id(table)
+        with self.lock:
+            if table_id not in self.schemas:
+                raise NotFound(f"Table {table_id} not found")
+            if "schema" in fields:
+                existing = {field.name for field in self.schemas[table_id]}
+                for field in table.schema:
+                    if field.name not in existing:
+                        self.conn.execute(f'ALTER TABLE "{table_id}" ADD COLUMN "{field.name}" '
+                                          f'{SQLITE_TYPES.get(field.field_type, "TEXT")}')
+                        self.schemas[table_id].append(field)
+            if "clustering_fields" in fields:
+                self.layouts[table_id] = (self.layouts[table_id][0], table.clustering_fields)
+        return self.get_table(table_id)
+
+    # Copy a table, with its partitioning and clustering, to a destination that does not exist yet
+    def copy_table(self, source, destination, job_config=None):
+        source_id = self._table_id(source)
+        destination_id = self._table_id(destination)
+        with self.lock:
+            if source_id not in self.schemas:
+                raise NotFound(f"Table {source_id} not found")
+            if destination_id in self.schemas:
+                raise Conflict(f"Table {destination_id} already exists")
+            self._create(destination_id, self.schemas[source_id], *self.layouts[source_id])
+            self.conn.execute(f'INSERT INTO "{destination_id}" SELECT * FROM "{source_id}"')
+            return FakeQueryJob([])
+
+    # Run a query or a multi-statement script; a failing script is rolled back as a whole
+    def query(self, sql, job_config=None):
+        with self.lock:
+            self.queries.append(sql)
+            statement = sql.strip()
+            if statement.upper().startswith("CREATE OR REPLACE VIEW"):
+                # SQLite has no CREATE OR REPLACE VIEW; drop the view and create it again
+                view_id = statement.split()[4]
+                statement = f"DROP VIEW IF EXISTS {view_id}; CREATE VIEW{statement[len('CREATE OR REPLACE VIEW'):]}"
+            # BigQuery date parts are bare keywords; pass them to the SQLite function as strings
+            statement = re.sub(r"DATE_TRUNC\(([^,()]+),\s*(ISOWEEK|MONTH)\)", r"DATE_TRUNC(\1, '\2')", statement)
+            # CAST goes through BQ_CAST, which converts values the way BigQuery would
+            statement = re.sub(r"CAST\((\w+) AS (\w+)\)", r"BQ_CAST(\1, '\2')", statement)
+            if statement.upper().startswith(("SELECT", "WITH")):
+                return FakeQueryJob([dict(row) for row in self.conn.execute(statement)])
+            try:
+                self.conn.executescript(statement)
+            except Exception:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+            return FakeQueryJob([])
+
+    def _insert(self, table_id, columns, rows):
+        placeholders = ", ".join("?" for _ in columns)
+        names = ", ".join(f'"{column}"' for column in columns)
+        self.conn.executemany(f'INSERT INTO "{table_id}" ({names}) VALUES ({placeholders})', rows)
+
+    # Convert an Arrow value into something SQLite stores the way BigQuery would return it
+    def _sqlite_value(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat(' ')
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    def load_table_from_file(self, file_obj, destination, job_config=None):
+        table_id = self._table_id(destination)
+        table = pq.read_table(file_obj)
+        with self.lock:
+            if table_id not in self.schemas:
+                self._create(table_id, job_config.schema)
+            if job_config.write_disposition == "WRITE_TRUNCATE":
+                self.conn.execute(f'DELETE FROM "{table_id}"')
+
+            columns = table.column_names
+            rows = [[self._sqlite_value(row[column]) for column in columns] for row in table.to_pylist()]
+            self._insert(table_id, columns, rows)
+
+            self.load_jobs.append((table_id, len(rows)))
+            return FakeLoadJob(len(rows))
+
+    # Function to read a table back as a list of dicts, for checking what a run wrote
+    def fetch_rows(self, table_id):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(f'SELECT * FROM "{table_id}"')]
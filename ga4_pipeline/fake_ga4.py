@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from google.analytics.data_v1beta.types import (BatchRunReportsResponse, DimensionMetadata, Metadata, MetricMetadata,
+                                                MetricType, RunReportResponse)
+
+from .reports import REPORTS
+
+# GA4 metric types for the metrics our reports request; anything else is reported as an integer
+METRIC_TYPES = {
+    "averageSessionDuration": MetricType.TYPE_SECONDS,
+    "screenPageViewsPerSession": MetricType.TYPE_FLOAT,
+    "screenPageViewsPerUser": MetricType.TYPE_FLOAT,
+    "advertiserAdCost": MetricType.TYPE_CURRENCY,
+    "advertiserAdCostPerClick": MetricType.TYPE_CURRENCY,
+}
+
+# Quota GA4 grants a standard property, used for the fake property_quota
+TOKENS_PER_DAY = 200000
+TOKENS_PER_HOUR = 40000
+TOKENS_PER_PROJECT_PER_HOUR = 14000
+
+
+# Local stand-in for BetaAnalyticsDataClient that serves synthetic, deterministic reports
+# rows_per_day controls how many rows each day produces, cardinality how many distinct
+# values the secondary dimensions take, and latency how long each call blocks
+class FakeAnalyticsDataClient:
+    def __init__(self, rows_per_day=10, cardinality=5, latency=0.0):
+        self.rows_per_day = rows_per_day
+        self.cardinality = cardinality
+        self.latency = latency
+        self.calls = []
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.tokens_used = {}
+        self.lock = threading.Lock()
+
+    def _enter(self, property_name):
+        with self.lock:
+            self.calls.append(property_name)
+            self.in_flight[property_name] = self.in_flight.get(property_name, 0) + 1
+            self.max_in_flight[property_name] = max(self.max_in_flight.get(property_name, 0),
+                                                    self.in_flight[property_name])
+
+    def _exit(self, property_name):
+        with self.lock:
+            self.in_flight[property_name] -= 1
+
+    # Build the list of days covered by the request's first date range
+    def _days(self, request):
+        date_range = request.date_ranges[0]
+        start = datetime.strptime(date_range.start_date, '%Y-%m-%d')
+        end = datetime.strptime(date_range.end_date, '%Y-%m-%d')
+        return [(start + timedelta(days=i)).strftime('%Y%m%d') for i in range((end - start).days + 1)]
+
+    def _build_response(self, request):
+        dimension_names = [dimension.name for dimension in request.dimensions]
+        metric_names = [metric.name for metric in request.metrics]
+        days = self._days(request)
+
+        # Without a secondary dimension every day collapses to a single row
+        rows_per_day = self.rows_per_day if len(dimension_names) > 1 else 1
+        row_count = len(days) * rows_per_day
+        offset = request.offset
+        limit = request.limit or 10000
+        seed = sum(ord(c) for c in request.property)
+
+        response = RunReportResponse.pb()()
+        response.row_count = row_count
+        for name in dimension_names:
+            response.dimension_headers.add(name=name)
+        for name in metric_names:
+            response.metric_headers.add(name=name, type_=METRIC_TYPES.get(name, MetricType.TYPE_INTEGER))
+
+        for index in range(offset, min(offset + limit, row_count)):
+            day, position = divmod(index, rows_per_day)
+            row = response.rows.add()
+            for dimension_index, name in enumerate(dimension_names):
+                if name == "date":
+                    value = days[day]
+                elif dimension_index == 1:
+                    value = f"{name}_{position}"
+                else:
+                    value = f"{name}_{position % self.cardinality}"
+                row.dimension_values.add(value=value)
+            for metric_index, name in enumerate(metric_names):
+                raw = (index * 2654435761 + metric_index * 97 + seed) % 1000
+                if METRIC_TYPES.get(name, MetricType.TYPE_INTEGER) == MetricType.TYPE_INTEGER:
+                    row.metric_values.add(value=str(raw))
+                else:
+                    row.metric_values.add(value=str(raw / 7))
+
+        if request.return_property_quota:
+            self._charge_quota(request.property, response, len(response.rows))
+        return RunReportResponse.wrap(response)
+
+    # Charge a token per 10,000 rows returned (at least one) and report what is left, like GA4 does
+    def _charge_quota(self, property_name, response, rows):
+        tokens = max(1, rows // 10000)
+        with self.lock:
+            used = self.tokens_used[property_name] = self.tokens_used.get(property_name, 0) + tokens
+        quota = response.property_quota
+        for status, limit in ((quota.tokens_per_day, TOKENS_PER_DAY), (quota.tokens_per_hour, TOKENS_PER_HOUR),
+                              (quota.tokens_per_project_per_hour, TOKENS_PER_PROJECT_PER_HOUR)):
+            status.consumed = tokens
+            status.remaining = max(0, limit - used)
+
+    def run_report(self, request, **kwargs):
+        self._enter(request.property)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return self._build_response(request)
+        finally:
+            self._exit(request.property)
+
+    def batch_run_reports(self, request, **kwargs):
+        self._enter(request.property)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return BatchRunReportsResponse(reports=[self._build_response(report_request)
+                                                    for report_request in request.requests])
+        finally:
+            self._exit(request.property)
+
+    # Every dimension and metric the reports request, typed as in METRIC_TYPES
+    def get_metadata(self, name, **kwargs):
+        self._enter(name)
+        try:
+            dimensions = sorted({dimension for report in REPORTS.values() for dimension in report.dimensions})
+            metrics = sorted({metric for report in REPORTS.values() for metric in report.metrics})
+            return Metadata(name=name,
+                            dimensions=[DimensionMetadata(api_name=dimension) for dimension in dimensions],
+                            metrics=[MetricMetadata(api_name=metric,
+                                                    type_=METRIC_TYPES.get(metric, MetricType.TYPE_INTEGER))
+                                     for metric in metrics])
+        finally:
+            self._exit(name)
@@ -0,0 +1,171 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.analytics.data_v1beta.types import (BatchRunReportsRequest, DateRange, Dimension, Metric,
+                                                RunReportRequest)
+
+from .retry import RetryPolicy
+
+# Default number of GA4 requests in flight across all properties
+DEFAULT_MAX_WORKERS = 6
+
+# GA4 allows at most 10 concurrent requests per property; stay under it
+DEFAULT_PER_PROPERTY_CONCURRENCY = 5
+
+# Rows requested per page; GA4 caps a single response at 250,000 rows
+DEFAULT_PAGE_SIZE = 100000
+
+# GA4 accepts at most 5 reports in one batchRunReports call
+MAX_BATCH_REPORTS = 5
+
+# Sustained request rate and burst size allowed per property
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 5
+
+
+# Token bucket used to pace the requests sent to a single property
+class TokenBucket:
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    # Block until the requested number of tokens is available, then take them
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+# Wrapper around BetaAnalyticsDataClient that throttles every call per property and retries
+# transient errors; every retry waits for a fresh token like any other request
+class ThrottledAnalyticsClient:
+    def __init__(self, client, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST,
+                 per_property_concurrency=DEFAULT_PER_PROPERTY_CONCURRENCY, retry=None):
+        self.client = client
+        self.retry = retry or RetryPolicy()
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.per_property_concurrency = per_property_concurrency
+        self.buckets = {}
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    # Get (or lazily create) the bucket and concurrency guard for a property
+    def _limits_for(self, property_name):
+        with self.lock:
+            if property_name not in self.buckets:
+                self.buckets[property_name] = TokenBucket(self.requests_per_second, self.burst)
+                self.semaphores[property_name] = threading.BoundedSemaphore(self.per_property_concurrency)
+            return self.buckets[property_name], self.semaphores[property_name]
+
+    def _call(self, method_name, request, **kwargs):
+        bucket, semaphore = self._limits_for(request.property)
+
+        def attempt():
+            bucket.acquire()
+            with semaphore:
+                return getattr(self.client, method_name)(request, **kwargs)
+
+        return self.retry.call(attempt, description=f"{method_name} for {request.property}")
+
+    # Function to throttle another client with this one's per-property limits
+    # Requests through either client draw on the same buckets and concurrency guards
+    def sharing_limits(self, client, retry=None):
+        throttled = ThrottledAnalyticsClient(client, self.requests_per_second, self.burst,
+                                             self.per_property_concurrency, retry=retry or self.retry)
+        throttled.buckets, throttled.semaphores, throttled.lock = self.buckets, self.semaphores, self.lock
+        return throttled
+
+    def run_report(self, request, **kwargs):
+        return self._call('run_report', request, **kwargs)
+
+    def batch_run_reports(self, request, **kwargs):
+        return self._call('batch_run_reports', request, **kwargs)
+
+    # Anything else (metadata lookups etc.) goes straight to the wrapped client
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+# Function to build the GA4 request for a report over one property and date range
+# Every response reports the quota it consumed so the run report can track it
+def build_report_request(report, property_id, start_date, end_date):
+    return RunReportRequest(
+        property=f"properties/{property_id}",
+        date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
+        dimensions=[Dimension(name=name) for name in report.dimensions],
+        metrics=[Metric(name=name) for name in report.metrics],
+        return_property_quota=True
+    )
+
+
+# Function to page through up to MAX_BATCH_REPORTS reports for one property together,
+# sending the reports that still have rows left in a single batchRunReports call per round
+# Yields a list of (request index, response, finished) for each round
+def iter_batch_report_pages(client, property_id, requests, page_size=DEFAULT_PAGE_SIZE):
+    offsets = [0] * len(requests)
+    pending = list(range(len(requests)))
+    while pending:
+        for index in pending:
+            requests[index].offset = offsets[index]
+            requests[index].limit = page_size
+
+        # A lone report goes through run_report; there is nothing to batch it with
+        if len(pending) == 1:
+            responses = [client.run_report(requests[pending[0]])]
+        else:
+            batch_request = BatchRunReportsRequest(property=f"properties/{property_id}",
+                                                   requests=[requests[index] for index in pending])
+            responses = client.batch_run_reports(batch_request).reports
+
+        page = []
+        still_pending = []
+        for index, response in zip(pending, responses):
+            offsets[index] += len(response.rows)
+            finished = not response.rows or offsets[index] >= response.row_count
+            page.append((index, response, finished))
+            if not finished:
+                still_pending.append(index)
+        yield page
+
+        pending = still_pending
+
+
+# Function to run fetch_fn over every task with bounded parallelism, keeping the task order
+def fetch_concurrently(fetch_fn, tasks, max_workers=DEFAULT_MAX_WORKERS):
+    tasks = list(tasks)
+    if max_workers <= 1 or len(tasks) <= 1:
+        return [fetch_fn(*task) for task in tasks]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch_fn, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+# Function to add the fetch concurrency options to the CLI
+def add_fetch_arguments(parser):
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Maximum number of GA4 requests in flight at once")
+    parser.add_argument('--requests-per-second', type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Sustained GA4 request rate allowed per property")
+    parser.add_argument('--burst', type=int, default=DEFAULT_BURST,
+                        help="Number of GA4 requests a property may send back to back")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help="Rows requested per GA4 report page")
+    return parser
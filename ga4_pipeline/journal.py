@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+# Default location of the journal of the latest run
+DEFAULT_JOURNAL_PATH = 'run_journal.json'
+
+# Unit states: planned, fetched from GA4 or the cache, given up on after retries, or applied to BigQuery
+PENDING = 'pending'
+FETCHED = 'fetched'
+FAILED = 'failed'
+LOADED = 'loaded'
+
+
+# Journal of one run: the date range it covers, the state of every (report, property, shard) and,
+# per report, the [first_day, last_day] of loaded rows whose rollup periods are not yet rebuilt
+# It is rewritten atomically at each checkpoint so an interrupted run can be resumed from it
+class RunJournal:
+    def __init__(self, path, run_id, end_date, units=None, status='running', rollups=None):
+        self.path = path
+        self.run_id = run_id
+        self.end_date = end_date
+        self.units = units or {}
+        self.status = status
+        self.rollups = rollups or {}
+        self.lock = threading.Lock()
+
+    # Function to start the journal of a new run
+    @classmethod
+    def start(cls, path, end_date):
+        return cls(path, uuid.uuid4().hex[:12], end_date)
+
+    # Function to read the journal of the last run, or None if there is none
+    @classmethod
+    def load(cls, path=DEFAULT_JOURNAL_PATH):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        return cls(path, data["run_id"], data["end_date"], data["units"], data["status"], data.get("rollups"))
+
+    # Journal key of a unit
+    @staticmethod
+    def key(report_name, property_id, start_date, end_date):
+        return f"{report_name}|{property_id}|{start_date}|{end_date}"
+
+    # Function to list the (report name, property, start, end, entry) of every unit in the journal
+    def entries(self):
+        return [tuple(key.split('|')) + (entry,) for key, entry in sorted(self.units.items())]
+
+    # Function to tell whether the run left units to resume or rollup periods to rebuild
+    def unfinished(self):
+        return bool(self.rollups) or any(entry["status"] != LOADED for entry in self.units.values())
+
+    # Function to record that a report's rows changed between first_day and last_day, widening any span
+    # already pending, so its rollup periods are rebuilt even if this run stops before they are
+    def add_rollup_span(self, report_name, first_day, last_day):
+        with self.lock:
+            pending = self.rollups.get(report_name)
+            if pending:
+                first_day, last_day = min(first_day, pending[0]), max(last_day, pending[1])
+            self.rollups[report_name] = [first_day, last_day]
+
+    # Function to list the pending rollup spans as {report name: (first_day, last_day)}
+    def rollup_spans(self):
+        with self.lock:
+            return {report_name: tuple(span) for report_name, span in self.rollups.items()}
+
+    # Function to mark every pending rollup span as rebuilt
+    def clear_rollups(self):
+        with self.lock:
+            self.rollups = {}
+
+    # Function to record a unit's state, with its rows, attempts and last error
+    def record(self, unit, status):
+        key = self.key(unit.report.name, unit.property_id, unit.start_date, unit.end_date)
+        with self.lock:
+            self.units[key] = {"status": status, "rows": unit.rows, "attempts": unit.attempts, "error": unit.error}
+
+    # Function to checkpoint the journal to disk
+    def save(self):
+        with self.lock:
+            data = {
+                "run_id": self.run_id,
+                "status": self.status,
+                "end_date": self.end_date,
+                "saved_at": datetime.now(timezone.utc).isoformat(),
+                "units": self.units,
+                "rollups": self.rollups,
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    # Function to mark the run as finished and write the final checkpoint
+    def finish(self):
+        self.status = 'finished'
+        self.save()
+        counts = {}
+        for entry in self.units.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        print(f"Run {self.run_id}: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+
+# Function to add the journal options to the CLI
+def add_journal_arguments(parser):
+    parser.add_argument('--journal-path', default=DEFAULT_JOURNAL_PATH,
+                        help="Path of the journal recording the state of every unit of the run")
+    parser.add_argument('--resume', action='store_true',
+                        help="Re-run only the units the last run did not load, over the same date range")
+    return parser
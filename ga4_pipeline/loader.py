@@ -0,0 +1,366 @@
+import os
+import queue
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from .metrics import RunMetrics
+from .retry import RetryPolicy
+
+# Staging tables expire on their own in case a run dies before dropping them
+STAGING_EXPIRATION_HOURS = 24
+
+# Compression codec for the Parquet files sent to BigQuery
+PARQUET_COMPRESSION = 'zstd'
+
+# A chunk of staged rows is flushed to a staging table once it reaches either threshold
+DEFAULT_FLUSH_ROWS = 500000
+DEFAULT_FLUSH_MB = 256
+
+# Decoded pages waiting for the loader; fetch threads block when it is full
+DEFAULT_QUEUE_SIZE = 16
+
+# Load jobs that may run at once while fetching carries on
+DEFAULT_LOAD_WORKERS = 2
+
+# Arrow type for each BigQuery field type a report can declare
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "FLOAT": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+    "DATE": pa.date32(),
+    "DATETIME": pa.timestamp('us'),
+    "TIMESTAMP": pa.timestamp('us', tz='UTC'),
+}
+
+
+# Function to build the Arrow schema for a report's (column, BigQuery type) pairs
+def arrow_schema(schema):
+    return pa.schema([pa.field(name, ARROW_TYPES[field_type]) for name, field_type in schema])
+
+
+# Function to convert a batch into an Arrow table with exactly the declared schema
+# Columns missing from the batch are loaded as NULL; extra columns are dropped
+def frame_to_arrow(df, schema):
+    arrays = []
+    for field in schema:
+        if field.name not in df:
+            arrays.append(pa.nulls(len(df), type=field.type))
+            continue
+
+        series = df[field.name]
+        if pa.types.is_date32(field.type) and pd.api.types.is_datetime64_any_dtype(series):
+            arrays.append(pa.array(series.to_numpy().astype('datetime64[D]'), type=field.type))
+        else:
+            arrays.append(pa.array(series, from_pandas=True).cast(field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# Column the spool tags every row with, naming the fetch attempt the row came from
+FETCH_ID_COLUMN = '_fetch_id'
+
+
+# Loader that streams a run's rows into BigQuery while they are still being fetched
+# Fetch threads hand decoded pages to add(), which puts them on a bounded queue. One consumer thread
+# converts them to Arrow and appends them to a zstd Parquet chunk. Whenever a chunk reaches the row
+# or byte threshold it is loaded into its own staging table in the background. commit() waits for
+# the last chunk and swaps the refreshed windows into the target in one transaction, so memory
+# stays flat however many properties a run covers.
+# schema is the report's (column, BigQuery type) pairs; key_column/date_column identify the rows a
+# refresh replaces, and without them rows are appended. Every page is tagged with the fetch that
+# produced it so rows from a failed or retried fetch are left out of the transaction. With
+# export_path every row is also kept in one Parquet file that replay_export can load again later.
+# Spooling, the load jobs and the transaction are timed into metrics; the load jobs and the
+# transaction are retried on transient errors, which is safe because both are all-or-nothing
+class StagedLoader:
+    def __init__(self, bq_client, table_id, schema, key_column=None, date_column=None, spool_dir=None,
+                 export_path=None, metrics=None, retry=None, flush_rows=DEFAULT_FLUSH_ROWS,
+                 flush_mb=DEFAULT_FLUSH_MB, queue_size=DEFAULT_QUEUE_SIZE, load_workers=DEFAULT_LOAD_WORKERS):
+        self.bq_client = bq_client
+        self.metrics = metrics or RunMetrics()
+        self.retry = retry or RetryPolicy()
+        self.table_id = table_id
+        self.key_column = key_column
+        self.date_column = date_column
+        self.schema = [bigquery.SchemaField(name, field_type) for name, field_type in schema]
+        self.spool_schema = tuple(schema) + ((FETCH_ID_COLUMN, "STRING"),)
+        self.arrow_schema = arrow_schema(self.spool_schema)
+        self.spool_dir = spool_dir
+        self.flush_rows = flush_rows
+        self.flush_bytes = int(flush_mb * 1024 * 1024)
+        self.export_path = export_path
+        if export_path:
+            os.makedirs(os.path.dirname(export_path) or '.', exist_ok=True)
+        self.export_writer = None
+
+        self.staged_rows = 0
+        self.rows_by_fetch = {}
+        self.chunk_writer = None
+        self.chunk_path = None
+        self.chunk_rows = 0
+        self.chunk_bytes = 0
+        self.staging_tables = []
+        self.loads = []
+        self.lock = threading.Lock()
+        self.load_executor = ThreadPoolExecutor(max_workers=load_workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.consumer = None
+
+    # Add a page of rows from one fetch; safe to call from several fetch threads
+    # Blocks while the queue is full, so fetching never runs ahead of the loader
+    def add(self, df, fetch_id=None):
+        if df.empty:
+            return
+
+        with self.lock:
+            if self.consumer is None:
+                self.consumer = threading.Thread(target=self._consume, name=f"loader-{self.table_id}", daemon=True)
+                self.consumer.start()
+        while True:
+            if self.error:
+                raise RuntimeError(f"Loader for {self.table_id} failed") from self.error
+            try:
+                self.queue.put((df, fetch_id), timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    # Consumer thread: write queued pages to the current chunk, flushing it when it is full
+    def _consume(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    self._flush()
+                    return
+                self._spool(*item)
+                if self.chunk_rows >= self.flush_rows or self.chunk_bytes >= self.flush_bytes:
+                    self._flush()
+        except Exception as e:
+            self.error = e
+            # Keep draining so fetch threads blocked on a full queue can finish
+            while self.queue.get() is not None:
+                pass
+
+    def _spool(self, df, fetch_id):
+        with self.metrics.stage("spool") as stage:
+            table = frame_to_arrow(df.assign(**{FETCH_ID_COLUMN: fetch_id}), self.arrow_schema)
+            stage.rows, stage.bytes = table.num_rows, table.nbytes
+            if self.chunk_writer is None:
+                fd, self.chunk_path = tempfile.mkstemp(suffix='.parquet', dir=self.spool_dir)
+                os.close(fd)
+                self.chunk_writer = pq.ParquetWriter(self.chunk_path, self.arrow_schema, compression=PARQUET_COMPRESSION)
+            self.chunk_writer.write_table(table)
+            if self.export_path:
+                if self.export_writer is None:
+                    self.export_writer = pq.ParquetWriter(self.export_path, self.arrow_schema,
+                                                          compression=PARQUET_COMPRESSION)
+                self.export_writer.write_table(table)
+
+        self.chunk_rows += table.num_rows
+        self.chunk_bytes += table.nbytes
+        self.staged_rows += table.num_rows
+        self.rows_by_fetch[fetch_id] = self.rows_by_fetch.get(fetch_id, 0) + table.num_rows
+
+    # Close the current chunk and load it into a new staging table in the background
+    def _flush(self):
+        if self.chunk_writer is None:
+            return
+        self.chunk_writer.close()
+        self.loads.append(self.load_executor.submit(self._load_chunk, self.chunk_path, True))
+        self.chunk_writer = None
+        self.chunk_path = None
+        self.chunk_rows = 0
+        self.chunk_bytes = 0
+
+    def _create_staging_table(self):
+        staging_table_id = f"{self.table_id}_staging_{uuid.uuid4().hex[:12]}"
+        staging_schema = [bigquery.SchemaField(name, field_type) for name, field_type in self.spool_schema]
+        staging_table = bigquery.Table(staging_table_id, schema=staging_schema)
+        staging_table.expires = datetime.now(timezone.utc) + timedelta(hours=STAGING_EXPIRATION_HOURS)
+        self.bq_client.create_table(staging_table)
+        with self.lock:
+            self.staging_tables.append(staging_table_id)
+        return staging_table_id
+
+    # Load one Parquet chunk into its own staging table; remove_file drops the chunk afterwards
+    def _load_chunk(self, path, remove_file):
+        try:
+            staging_table_id = self._create_staging_table()
+            # Truncating makes a retried load replace a half-finished one
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.PARQUET,
+                write_disposition="WRITE_TRUNCATE",
+            )
+
+            def load():
+                with open(path, 'rb') as parquet_file:
+                    job = self.bq_client.load_table_from_file(parquet_file, staging_table_id, job_config=job_config)
+                job.result()  # Wait for the job to complete
+                return job
+
+            with self.metrics.stage("load_job") as stage:
+                job = self.retry.call(load, description=f"load job for {staging_table_id}")
+                stage.rows, stage.bytes = job.output_rows, os.path.getsize(path)
+            print(f"Staged {job.output_rows} rows in {staging_table_id}.")
+            return job.output_rows
+        finally:
+            if remove_file and os.path.exists(path):
+                os.remove(path)
+
+    # Function to stage an existing Parquet file, written with this loader's schema, as one chunk
+    def stage_file(self, path):
+        rows = pq.ParquetFile(path).metadata.num_rows
+        self.staged_rows += rows
+        self.loads.append(self.load_executor.submit(self._load_chunk, path, False))
+        return rows
+
+    # Wait for the consumer to write and flush every queued page, and for every load job to finish
+    def _drain(self):
+        if self.consumer is not None:
+            self.queue.put(None)
+            self.consumer.join()
+        try:
+            for load in self.loads:
+                load.result()
+        finally:
+            self.load_executor.shutdown()
+            if self.export_writer is not None:
+                self.export_writer.close()
+        if self.error:
+            raise RuntimeError(f"Loader for {self.table_id} failed") from self.error
+
+    # Function to build the predicate covering every refreshed (key, start_date, end_date) window
+    # The leading range on the partition column lets BigQuery prune the DELETE to the refreshed days.
+    # Rows without a key were loaded before the table had one; a refreshed window replaces them too
+    def _window_predicate(self, windows):
+        first = min(start_date for _, start_date, _ in windows)
+        last = max(end_date for _, _, end_date in windows)
+        return f"{self.date_column} BETWEEN '{first}' AND '{last}' AND (" + " OR ".join(
+            f"(({self.key_column} = '{key}' OR {self.key_column} IS NULL) "
+            f"AND {self.date_column} BETWEEN '{start_date}' AND '{end_date}')"
+            for key, start_date, end_date in sorted(windows)
+        ) + ")"
+
+    # Rewrite the export without the rows of fetches that were not accepted, batch by batch
+    def _drop_rejected_rows(self, fetch_ids):
+        accepted = pa.array(sorted(fetch_ids), type=pa.string())
+        tmp_path = f"{self.export_path}.tmp"
+        with pq.ParquetWriter(tmp_path, self.arrow_schema, compression=PARQUET_COMPRESSION) as writer:
+            for batch in pq.ParquetFile(self.export_path).iter_batches():
+                table = pa.Table.from_batches([batch], schema=self.arrow_schema)
+                writer.write_table(table.filter(pc.is_in(table[FETCH_ID_COLUMN], value_set=accepted)))
+        os.replace(tmp_path, self.export_path)
+
+    # Apply the staged rows to the target atomically
+    # windows lists the (key, start_date, end_date) ranges that were refreshed; their old rows are
+    # replaced. fetch_ids names the fetches whose rows are applied; rows of any other fetch are left out
+    def commit(self, windows=None, fetch_ids=None):
+        try:
+            self._drain()
+
+            row_count = self.staged_rows
+            rejected = set()
+            if fetch_ids is not None:
+                fetch_ids = {fetch_id for fetch_id in fetch_ids if self.rows_by_fetch.get(fetch_id)}
+                rejected = set(self.rows_by_fetch) - fetch_ids
+                row_count = sum(self.rows_by_fetch[fetch_id] for fetch_id in fetch_ids)
+
+            # A refreshed window that came back empty still has its old rows deleted
+            deletes_windows = bool(self.key_column and windows)
+            if row_count == 0 and not deletes_windows:
+                print(f"No rows staged for {self.table_id}. Skipping load to BigQuery.")
+                return 0
+            if rejected and self.export_path:
+                self._drop_rejected_rows(fetch_ids)
+
+            # One transaction replaces the refreshed windows so readers never see them half-loaded
+            columns = ", ".join(field.name for field in self.schema)
+            staged = " UNION ALL ".join(f"SELECT {columns}, {FETCH_ID_COLUMN} FROM `{staging_table_id}`"
+                                        for staging_table_id in self.staging_tables)
+            conditions = []
+            if None in rejected:
+                conditions.append(f"{FETCH_ID_COLUMN} IS NOT NULL")
+            ids = ", ".join(f"'{fetch_id}'" for fetch_id in sorted(rejected - {None}))
+            if ids:
+                conditions.append(f"COALESCE({FETCH_ID_COLUMN}, '') NOT IN ({ids})")
+            insert_filter = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            statements = ["BEGIN TRANSACTION;"]
+            if deletes_windows:
+                statements.append(f"DELETE FROM `{self.table_id}` WHERE {self._window_predicate(windows)};")
+            if row_count:
+                statements.append(f"INSERT INTO `{self.table_id}` ({columns}) "
+                                  f"SELECT {columns} FROM ({staged}){insert_filter};")
+            statements.append("COMMIT TRANSACTION;")
+
+            with self.metrics.stage("merge") as stage:
+                # Wait for the transaction to finish; a failed transaction is rolled back, so it can be rerun
+                self.retry.call(lambda: self.bq_client.query("\n".join(statements)).result(),
+                                description=f"transaction on {self.table_id}")
+                stage.rows = row_count
+            self.metrics.count(f"rows_loaded:{self.table_id.split('.')[-1]}", row_count)
+            print(f"Loaded {row_count} rows into {self.table_id}.")
+            return row_count
+        finally:
+            for staging_table_id in self.staging_tables:
+                self.bq_client.delete_table(staging_table_id, not_found_ok=True)
+
+
+# Function to add the loader's streaming options to the CLI
+def add_loader_arguments(parser):
+    parser.add_argument('--flush-rows', type=int, default=DEFAULT_FLUSH_ROWS,
+                        help="Rows per chunk loaded into a staging table while fetching continues")
+    parser.add_argument('--flush-mb', type=float, default=DEFAULT_FLUSH_MB,
+                        help="Arrow size in MB at which a chunk is flushed even below --flush-rows")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Decoded pages that may wait for the loader before fetch threads pause")
+    return parser
+
+
+# Function to group a set of dates into (first, last) runs of consecutive days
+def date_runs(days):
+    runs = []
+    for day in sorted(days):
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [(first.isoformat(), last.isoformat()) for first, last in runs]
+
+
+# Function to find the (first, last) day in an exported Parquet file, or None when it has no rows
+def export_span(path, date_column):
+    days = pq.read_table(path, columns=[date_column])[date_column]
+    if len(days) == 0:
+        return None
+    span = pc.min_max(days)
+    return span["min"].as_py().isoformat(), span["max"].as_py().isoformat()
+
+
+# Function to load an exported Parquet file into its table again without touching GA4
+# Each key's windows are the runs of consecutive dates present in the file, so a shard that
+# failed when the export was written leaves its old rows alone
+def replay_export(bq_client, table_id, schema, path, key_column=None, date_column=None, metrics=None,
+                  retry=None):
+    loader = StagedLoader(bq_client, table_id, schema, key_column=key_column, date_column=date_column,
+                          metrics=metrics, retry=retry)
+    loader.stage_file(path)
+    if not key_column:
+        return loader.commit()
+
+    table = pq.read_table(path, columns=[key_column, date_column])
+    windows = []
+    for key in pc.unique(table[key_column]).to_pylist():
+        days = pc.unique(table.filter(pc.equal(table[key_column], key))[date_column]).to_pylist()
+        windows.extend((key, first, last) for first, last in date_runs(days))
+    return loader.commit(windows)
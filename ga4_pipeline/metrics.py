@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Default location of the machine-readable summary written at the end of every run
+DEFAULT_RUN_REPORT_PATH = 'run_report.json'
+
+# Prefix of every metric name in the OpenMetrics summary
+METRIC_PREFIX = 'ga4_pipeline'
+
+# GA4 quota windows recorded from each response's property_quota
+QUOTA_FIELDS = ("tokens_per_day", "tokens_per_hour", "tokens_per_project_per_hour")
+
+
+# Measurement of one timed call; callers fill in the rows and bytes it handled
+class Stage:
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+
+# Thread-safe recorder for per-stage wall time, rows and bytes, and for the GA4 quota each property used
+class RunMetrics:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started_at = datetime.now(timezone.utc)
+        self.started = clock()
+        self.stages = {}
+        self.properties = {}
+        self.counters = {}
+        self.latest_quota = {}
+        self.lock = threading.Lock()
+
+    # Time the enclosed block as one call of the named stage
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def _add_stage(self, name, seconds, stage):
+        with self.lock:
+            totals = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["rows"] += stage.rows
+            totals["bytes"] += stage.bytes
+
+    # Function to add to a run-level counter such as rows loaded per report
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Function to record the property_quota GA4 returned with a response
+    # Besides the run's totals it keeps the latest remaining quota of each property and when it was seen
+    def record_quota(self, property_id, property_quota):
+        if property_quota is None:
+            return
+        with self.lock:
+            totals = self.properties.setdefault(str(property_id), {"requests": 0, "tokens_consumed": 0})
+            totals["requests"] += 1
+            totals["tokens_consumed"] += property_quota.tokens_per_day.consumed
+            latest = {"observed_at": datetime.now(timezone.utc)}
+            for field in QUOTA_FIELDS:
+                remaining = getattr(property_quota, field).remaining
+                key = f"{field}_remaining"
+                totals[key] = min(totals.get(key, remaining), remaining)
+                latest[key] = remaining
+            self.latest_quota[str(property_id)] = latest
+
+    # Function to copy the latest remaining quota seen for every property
+    def quota_snapshot(self):
+        with self.lock:
+            return {property_id: dict(quota) for property_id, quota in self.latest_quota.items()}
+
+    # Function to summarise the run as a JSON-serialisable dict
+    def summary(self):
+        with self.lock:
+            return {
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "wall_seconds": round(self.clock() - self.started, 6),
+                "stages": {name: dict(totals, seconds=round(totals["seconds"], 6))
+                           for name, totals in sorted(self.stages.items())},
+                "properties": {property_id: dict(totals) for property_id, totals in sorted(self.properties.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "tokens_consumed": sum(totals["tokens_consumed"] for totals in self.properties.values()),
+            }
+
+    # Function to render the summary in the OpenMetrics text format
+    def openmetrics(self, summary=None):
+        summary = summary or self.summary()
+        lines = []
+
+        def family(name, help_text, samples):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{METRIC_PREFIX}_{name} {value}")
+
+        started = datetime.fromisoformat(summary["started_at"]).timestamp()
+        family("run_start_timestamp_seconds", "Start of the last run.", [({}, started)])
+        family("run_duration_seconds", "Wall time of the last run.", [({}, summary["wall_seconds"])])
+        for field in ("seconds", "calls", "rows", "bytes"):
+            family(f"stage_{field}", f"Stage {field} in the last run.",
+                   [({"stage": name}, totals[field]) for name, totals in summary["stages"].items()])
+        family("counter", "Run-level counters of the last run.",
+               [({"name": name}, value) for name, value in summary["counters"].items()])
+        family("quota_tokens_consumed", "GA4 quota tokens consumed in the last run.",
+               [({"property": property_id}, totals["tokens_consumed"])
+                for property_id, totals in summary["properties"].items()])
+        for field in QUOTA_FIELDS:
+            family(f"quota_{field}_remaining", f"Lowest GA4 {field} quota left during the last run.",
+                   [({"property": property_id}, totals[f"{field}_remaining"])
+                    for property_id, totals in summary["properties"].items() if f"{field}_remaining" in totals])
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    # Function to write the run report, and the OpenMetrics summary when a path is given
+    def write(self, path=DEFAULT_RUN_REPORT_PATH, openmetrics_path=None):
+        summary = self.summary()
+        _write_atomic(path, json.dumps(summary, indent=2))
+        if openmetrics_path:
+            _write_atomic(openmetrics_path, self.openmetrics(summary))
+        print(f"Run took {summary['wall_seconds']:.1f}s; wrote run report to {path}.")
+        return summary
+
+
+class _StageTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.stage = Stage()
+
+    def __enter__(self):
+        self.started = self.metrics.clock()
+        return self.stage
+
+    def __exit__(self, *exc_info):
+        self.metrics._add_stage(self.name, self.metrics.clock() - self.started, self.stage)
+        return False
+
+
+# Function to replace a file in one step so a scraper never reads a half-written report
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Wrapper around BetaAnalyticsDataClient that times every report call and records its rows,
+# response bytes and the GA4 quota it consumed; wrap it in the throttle so waits are not counted
+# quota_metrics, when given, also receives every quota reading, e.g. a scheduler watching all its jobs
+class InstrumentedAnalyticsClient:
+    def __init__(self, client, metrics, quota_metrics=None):
+        self.client = client
+        self.metrics = metrics
+        self.quota_metrics = quota_metrics
+
+    def run_report(self, request, **kwargs):
+        with self.metrics.stage("ga4_request") as stage:
+            response = self.client.run_report(request, **kwargs)
+            self._record(request.property, stage, [response])
+        return response
+
+    def batch_run_reports(self, request, **kwargs):
+        with self.metrics.stage("ga4_request") as stage:
+            response = self.client.batch_run_reports(request, **kwargs)
+            self._record(request.property, stage, response.reports)
+        return response
+
+    def _record(self, property_name, stage, responses):
+        property_id = property_name.split('/')[-1]
+        for response in responses:
+            pb = type(response).pb(response)
+            stage.rows += len(pb.rows)
+            stage.bytes += pb.ByteSize()
+            if pb.HasField("property_quota"):
+                self.metrics.record_quota(property_id, pb.property_quota)
+                if self.quota_metrics is not None:
+                    self.quota_metrics.record_quota(property_id, pb.property_quota)
+
+    # Anything else (metadata lookups etc.) goes straight to the wrapped client
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+# Function to add the run report options to the CLI
+def add_metrics_arguments(parser):
+    parser.add_argument('--run-report-path', default=DEFAULT_RUN_REPORT_PATH,
+                        help="Where to write the JSON summary of each run's stage timings and GA4 quota")
+    parser.add_argument('--openmetrics-path',
+                        help="Also write the summary in OpenMetrics text format, e.g. for a textfile collector")
+    return parser
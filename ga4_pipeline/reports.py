@@ -0,0 +1,119 @@
+import hashlib
+from dataclasses import dataclass
+
+
+# Declarative description of one GA4 report and the BigQuery table it is loaded into
+# schema lists (column, BigQuery type) pairs in table order; column_names holds
+# (GA4 name, column) pairs for fields renamed in the table; key_column/date_column
+# identify the rows a refresh replaces; the table is partitioned by day on date_column and
+# clustered on cluster_columns
+@dataclass(frozen=True)
+class ReportDefinition:
+    name: str
+    dimensions: tuple
+    metrics: tuple
+    schema: tuple
+    date_column: str
+    key_column: str = None
+    column_names: tuple = ()
+    cluster_columns: tuple = ()
+
+    @property
+    def table_name(self):
+        return self.name
+
+    def table_id(self, dataset_id):
+        return f"{dataset_id}.{self.table_name}"
+
+    # Table column for a GA4 dimension or metric
+    def column_for(self, ga4_name):
+        return dict(self.column_names).get(ga4_name, ga4_name)
+
+    # Columns that identify a row: the key, the date and every dimension
+    def row_key_columns(self):
+        columns = [self.column_for(name) for name in self.dimensions]
+        if self.key_column:
+            columns.insert(0, self.key_column)
+        return columns
+
+    def field_type(self, column):
+        return dict(self.schema)[column]
+
+    # Stable hash of everything that shapes the report's rows; changes whenever the definition does
+    def fingerprint(self):
+        definition = (self.dimensions, self.metrics, self.schema, self.column_names, self.date_column)
+        return hashlib.sha1(repr(definition).encode()).hexdigest()[:16]
+
+
+# New users and engaged sessions by property and date
+SESSION_DATA = ReportDefinition(
+    name="SessionData",
+    dimensions=("date",),
+    metrics=("newUsers", "engagedSessions"),
+    schema=(
+        ("Date", "DATE"),
+        ("newUsers", "INTEGER"),
+        ("engagedSessions", "INTEGER"),
+        ("Community_ID", "STRING"),
+    ),
+    date_column="Date",
+    key_column="Community_ID",
+    column_names=(("date", "Date"),),
+    cluster_columns=("Community_ID",),
+)
+
+# Event names, counts, active users, sessions and engagement by community and date
+WEB_EVENT_DATA = ReportDefinition(
+    name="WebEventData",
+    dimensions=("date", "eventName"),
+    metrics=(
+        "eventCount",
+        "activeUsers",
+        "newUsers",
+        "screenPageViews",
+        "screenPageViewsPerSession",
+        "screenPageViewsPerUser",
+        "averageSessionDuration",
+        "sessions",
+    ),
+    schema=(
+        ("Community_ID", "STRING"),
+        ("eventName", "STRING"),
+        ("eventCount", "INTEGER"),
+        ("activeUsers", "INTEGER"),
+        ("newUsers", "INTEGER"),
+        ("screenPageViews", "INTEGER"),
+        ("screenPageViewsPerSession", "FLOAT"),
+        ("screenPageViewsPerUser", "FLOAT"),
+        ("averageSessionDuration", "FLOAT"),
+        ("sessions", "INTEGER"),
+        ("Date", "DATE"),
+    ),
+    date_column="Date",
+    key_column="Community_ID",
+    column_names=(("date", "Date"),),
+    cluster_columns=("Community_ID", "eventName"),
+)
+
+# Google Ads cost, clicks and impressions by property, campaign, account and date
+AD_DATA = ReportDefinition(
+    name="ga4_ad_data_pull",
+    dimensions=("date", "firstUserGoogleAdsCampaignName", "firstUserGoogleAdsAccountName"),
+    metrics=("advertiserAdCost", "advertiserAdCostPerClick", "advertiserAdClicks", "advertiserAdImpressions"),
+    schema=(
+        ("date", "DATE"),
+        ("firstUserGoogleAdsCampaignName", "STRING"),
+        ("firstUserGoogleAdsAccountName", "STRING"),
+        ("advertiserAdCost", "FLOAT"),
+        ("advertiserAdCostPerClick", "FLOAT"),
+        ("advertiserAdClicks", "FLOAT"),
+        ("advertiserAdImpressions", "FLOAT"),
+        ("Community_ID", "STRING"),
+    ),
+    date_column="date",
+    key_column="Community_ID",
+    cluster_columns=("Community_ID", "firstUserGoogleAdsCampaignName"),
+)
+
+# Registry of every report the pipeline can run, keyed by name
+REPORTS = {report.name: report for report in (SESSION_DATA, WEB_EVENT_DATA, AD_DATA)}
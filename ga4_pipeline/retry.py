@@ -0,0 +1,76 @@
+import random
+import time
+
+# Times a transient GA4 or BigQuery error is retried before it is raised
+DEFAULT_RETRIES = 5
+
+# Backoff doubles from the base delay up to the cap; each wait is drawn uniformly below it ("full jitter")
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+
+# Errors worth retrying: quota and rate limits, server-side failures, timeouts and dropped connections
+# google.api_core is imported on first use, so importing this module stays cheap
+def transient_errors():
+    from google.api_core import exceptions
+
+    return (
+        exceptions.TooManyRequests,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.InternalServerError,
+        exceptions.BadGateway,
+        exceptions.GatewayTimeout,
+        exceptions.DeadlineExceeded,
+        exceptions.Aborted,
+        ConnectionError,
+        TimeoutError,
+    )
+
+
+# Retries a call on transient errors with jittered exponential backoff
+class RetryPolicy:
+    def __init__(self, retries=DEFAULT_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 metrics=None, sleep=time.sleep, rand=random.random):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self.sleep = sleep
+        self.rand = rand
+
+    # Function to build the policy configured on the command line
+    @classmethod
+    def from_options(cls, options, metrics=None):
+        return cls(options.retries, options.retry_base_delay, options.retry_max_delay, metrics=metrics)
+
+    # Wait before retry number attempt + 1
+    def delay(self, attempt):
+        return self.rand() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+    # Function to call fn, retrying it on transient errors; anything else is raised straight away
+    def call(self, fn, description="call"):
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except transient_errors() as e:
+                if attempt >= self.retries:
+                    raise
+                wait = self.delay(attempt)
+                attempt += 1
+                print(f"Transient error in {description} ({e}); retry {attempt} of {self.retries} in {wait:.1f}s.")
+                if self.metrics:
+                    self.metrics.count("transient_retries")
+                self.sleep(wait)
+
+
+# Function to add the retry options to the CLI
+def add_retry_arguments(parser):
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="Times a transient GA4 or BigQuery error is retried with backoff")
+    parser.add_argument('--retry-base-delay', type=float, default=DEFAULT_BASE_DELAY,
+                        help="Base delay in seconds of the jittered exponential backoff")
+    parser.add_argument('--retry-max-delay', type=float, default=DEFAULT_MAX_DELAY,
+                        help="Longest wait in seconds between two retries")
+    return parser
@@ -0,0 +1,207 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from .metrics import RunMetrics
+from .reports import AD_DATA, REPORTS, SESSION_DATA, WEB_EVENT_DATA
+from .retry import RetryPolicy
+
+# Period each rollup table aggregates to, with BigQuery's DATE_TRUNC part for it; weeks start on Monday
+GRAINS = {"weekly": "ISOWEEK", "monthly": "MONTH"}
+
+
+# Declarative description of one rollup table, rebuilt period by period from daily report rows
+# daily_sql selects the daily rows from {dataset} between {start} and {end}; group_columns are kept
+# as they are, and measures and ratios are (column, BigQuery type, aggregate expression) triples.
+# Measures carry the sums and counts that ratios are computed from, so a ratio is always the sum of
+# its numerator over the sum of its denominator, never an average of daily averages
+@dataclass(frozen=True)
+class RollupDefinition:
+    name: str
+    grain: str
+    sources: tuple
+    daily_sql: str
+    group_columns: tuple
+    measures: tuple
+    ratios: tuple = ()
+    date_column: str = "period_start"
+    cluster_columns: tuple = ("Community_ID",)
+
+    @property
+    def table_name(self):
+        return f"{self.name}_{self.grain}"
+
+    def table_id(self, dataset_id):
+        return f"{dataset_id}.{self.table_name}"
+
+    # (column, BigQuery type) pairs in table order, so the table can be created like a report's
+    @property
+    def schema(self):
+        return ((self.date_column, "DATE"),) + self.group_columns + tuple(
+            (column, field_type) for column, field_type, _ in self.measures + self.ratios)
+
+
+# Function to find the first day of the period a day falls in
+def period_start(day, grain):
+    if grain == "weekly":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+# Function to find the last day of the period a day falls in
+def period_end(day, grain):
+    if grain == "weekly":
+        return period_start(day, grain) + timedelta(days=6)
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+# Session and ad figures joined by property and date, so cost can be set against the users it brought
+SESSION_AD_DAILY_SQL = (
+    "SELECT COALESCE(s.Community_ID, a.Community_ID) AS Community_ID, COALESCE(s.Date, a.date) AS Date, "
+    "s.newUsers, s.engagedSessions, a.advertiserAdCost, a.advertiserAdClicks, a.advertiserAdImpressions "
+    f"FROM (SELECT Community_ID, Date, SUM(newUsers) AS newUsers, SUM(engagedSessions) AS engagedSessions "
+    f"FROM `{{dataset}}.{SESSION_DATA.table_name}` WHERE Date BETWEEN '{{start}}' AND '{{end}}' "
+    "AND Community_ID IS NOT NULL GROUP BY Community_ID, Date) AS s "
+    "FULL OUTER JOIN (SELECT Community_ID, date, SUM(advertiserAdCost) AS advertiserAdCost, "
+    "SUM(advertiserAdClicks) AS advertiserAdClicks, SUM(advertiserAdImpressions) AS advertiserAdImpressions "
+    f"FROM `{{dataset}}.{AD_DATA.table_name}` WHERE date BETWEEN '{{start}}' AND '{{end}}' "
+    "AND Community_ID IS NOT NULL GROUP BY Community_ID, date) AS a "
+    "ON s.Community_ID = a.Community_ID AND s.Date = a.date"
+)
+
+SESSION_AD_MEASURES = (
+    ("days", "INTEGER", "COUNT(DISTINCT Date)"),
+    ("newUsers", "INTEGER", "SUM(newUsers)"),
+    ("engagedSessions", "INTEGER", "SUM(engagedSessions)"),
+    ("advertiserAdCost", "FLOAT", "SUM(advertiserAdCost)"),
+    ("advertiserAdClicks", "FLOAT", "SUM(advertiserAdClicks)"),
+    ("advertiserAdImpressions", "FLOAT", "SUM(advertiserAdImpressions)"),
+)
+
+SESSION_AD_RATIOS = (
+    ("costPerNewUser", "FLOAT", "SAFE_DIVIDE(SUM(advertiserAdCost), SUM(newUsers))"),
+    ("advertiserAdCostPerClick", "FLOAT", "SAFE_DIVIDE(SUM(advertiserAdCost), SUM(advertiserAdClicks))"),
+)
+
+# Web events by property and event name; activeUsers is summed per day, so it counts user-days
+WEB_EVENT_DAILY_SQL = (
+    f"SELECT * FROM `{{dataset}}.{WEB_EVENT_DATA.table_name}` WHERE Date BETWEEN '{{start}}' AND '{{end}}' "
+    "AND Community_ID IS NOT NULL"
+)
+
+WEB_EVENT_MEASURES = (
+    ("days", "INTEGER", "COUNT(DISTINCT Date)"),
+    ("eventCount", "INTEGER", "SUM(eventCount)"),
+    ("activeUserDays", "INTEGER", "SUM(activeUsers)"),
+    ("newUsers", "INTEGER", "SUM(newUsers)"),
+    ("screenPageViews", "INTEGER", "SUM(screenPageViews)"),
+    ("sessions", "INTEGER", "SUM(sessions)"),
+    ("sessionDurationSeconds", "FLOAT", "SUM(averageSessionDuration * sessions)"),
+)
+
+WEB_EVENT_RATIOS = (
+    ("screenPageViewsPerSession", "FLOAT", "SAFE_DIVIDE(SUM(screenPageViews), SUM(sessions))"),
+    # Per user-day, not per user: distinct users in a period cannot be summed from daily counts
+    ("screenPageViewsPerUserDay", "FLOAT", "SAFE_DIVIDE(SUM(screenPageViews), SUM(activeUsers))"),
+    ("averageSessionDuration", "FLOAT", "SAFE_DIVIDE(SUM(averageSessionDuration * sessions), SUM(sessions))"),
+)
+
+# Registry of every rollup table, keyed by table name
+ROLLUPS = {}
+for _grain in GRAINS:
+    for _rollup in (
+        RollupDefinition(
+            name="SessionAdData",
+            grain=_grain,
+            sources=(SESSION_DATA.name, AD_DATA.name),
+            daily_sql=SESSION_AD_DAILY_SQL,
+            group_columns=(("Community_ID", "STRING"),),
+            measures=SESSION_AD_MEASURES,
+            ratios=SESSION_AD_RATIOS,
+        ),
+        RollupDefinition(
+            name="WebEventData",
+            grain=_grain,
+            sources=(WEB_EVENT_DATA.name,),
+            daily_sql=WEB_EVENT_DAILY_SQL,
+            group_columns=(("Community_ID", "STRING"), ("eventName", "STRING")),
+            measures=WEB_EVENT_MEASURES,
+            ratios=WEB_EVENT_RATIOS,
+            cluster_columns=("Community_ID", "eventName"),
+        ),
+    ):
+        ROLLUPS[_rollup.table_name] = _rollup
+
+
+# Function to recompute every period of a rollup that overlaps first_day..last_day, in one transaction
+# Whole periods are rebuilt from the daily rows, so a late correction to one day fixes its week and month
+def refresh_rollup(bq_client, rollup, dataset_id, first_day, last_day, metrics=None, retry=None):
+    metrics = metrics or RunMetrics()
+    retry = retry or RetryPolicy()
+    start = period_start(date.fromisoformat(first_day), rollup.grain)
+    end = period_end(date.fromisoformat(last_day), rollup.grain)
+
+    # clients pulls in google-cloud-bigquery, so it is imported only when a rollup is actually refreshed
+    from .clients import ensure_table
+
+    # The daily SQL reads every source table, including reports this run did not select
+    for source in rollup.sources:
+        ensure_table(bq_client, REPORTS[source], dataset_id)
+    table_id = ensure_table(bq_client, rollup, dataset_id)
+    daily = rollup.daily_sql.format(dataset=dataset_id, start=start.isoformat(), end=end.isoformat())
+    groups = ", ".join(column for column, _ in rollup.group_columns)
+    columns = ", ".join(column for column, _ in rollup.schema)
+    aggregates = ", ".join(f"{expression} AS {column}" for column, _, expression in rollup.measures + rollup.ratios)
+    statements = [
+        "BEGIN TRANSACTION;",
+        f"DELETE FROM `{table_id}` WHERE {rollup.date_column} BETWEEN '{start}' AND '{end}';",
+        f"INSERT INTO `{table_id}` ({columns}) "
+        f"SELECT DATE_TRUNC(Date, {GRAINS[rollup.grain]}) AS {rollup.date_column}, {groups}, {aggregates} "
+        f"FROM ({daily}) GROUP BY {rollup.date_column}, {groups};",
+        "COMMIT TRANSACTION;",
+    ]
+
+    with metrics.stage("rollup"):
+        retry.call(lambda: bq_client.query("\n".join(statements)).result(),
+                   description=f"rollup refresh of {table_id}")
+    print(f"Refreshed {table_id} from {start} to {end}.")
+    return start, end
+
+
+# Function to refresh every rollup fed by the reports whose rows changed
+# touched maps a report name to the (first_day, last_day) its refreshed windows covered
+def refresh_rollups(bq_client, dataset_id, touched, metrics=None, retry=None):
+    for rollup in ROLLUPS.values():
+        spans = [touched[source] for source in rollup.sources if source in touched]
+        if spans:
+            refresh_rollup(bq_client, rollup, dataset_id, min(first for first, _ in spans),
+                           max(last for _, last in spans), metrics=metrics, retry=retry)
+
+
+# Function to find the days a report table holds rows for, or None when it is empty
+def table_span(bq_client, report, dataset_id):
+    rows = bq_client.query(f"SELECT MIN({report.date_column}) AS first_day, MAX({report.date_column}) AS last_day "
+                           f"FROM `{report.table_id(dataset_id)}`").result()
+    row = next(iter(rows))
+    if row["first_day"] is None:
+        return None
+    return str(row["first_day"]), str(row["last_day"])
+
+
+# Function to find the span of every report table, for rebuilding the rollups over all of history
+def history_spans(bq_client, dataset_id):
+    from .clients import ensure_table
+
+    spans = {}
+    for report in REPORTS.values():
+        ensure_table(bq_client, report, dataset_id)
+        span = table_span(bq_client, report, dataset_id)
+        if span:
+            spans[report.name] = span
+    return spans
+
+
+# Function to add the rollup options to the CLI
+def add_rollup_arguments(parser):
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help="Recompute the weekly and monthly rollup tables over the whole history of their reports")
+    return parser
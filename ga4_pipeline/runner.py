@@ -0,0 +1,359 @@
+import glob
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from itertools import zip_longest
+
+from .cache import ResponseCache
+from .clients import ensure_dataset, ensure_table
+from .compaction import compact_table
+from .communities import ensure_community_view, property_index, sync_communities
+from .decode import response_to_frame
+from .fetch import MAX_BATCH_REPORTS, build_report_request, fetch_concurrently, iter_batch_report_pages
+from .journal import FAILED, FETCHED, LOADED, PENDING, RunJournal
+from .loader import StagedLoader, export_span, replay_export
+from .metrics import RunMetrics
+from .reports import ReportDefinition
+from .retry import RetryPolicy
+from .rollups import history_spans, refresh_rollups
+from .shards import date_shards
+from .state import get_watermark, incremental_start_date, load_state, save_report_state, set_watermark
+
+
+# One report to refresh for one property over one date shard
+# fetch_start/fetch_end narrow the shard to the days the cache cannot serve; both are None
+# when every day comes from the cache. fetched, rows and fetch_ids record what was staged for it,
+# attempts and error how its fetches went; loaded marks a unit a resumed run already applied
+@dataclass
+class FetchUnit:
+    report: ReportDefinition
+    property_id: str
+    start_date: str
+    end_date: str
+    fetch_start: str = None
+    fetch_end: str = None
+    fetched: bool = False
+    rows: int = 0
+    fetch_ids: list = field(default_factory=list)
+    attempts: int = 0
+    error: str = None
+    loaded: bool = False
+
+
+# Function to work out where a report's Parquet export for this run goes, if exports are enabled
+def export_path(export_dir, report, run_started):
+    if not export_dir:
+        return None
+    return os.path.join(export_dir, report.name, f"{run_started:%Y%m%dT%H%M%S}.parquet")
+
+
+# Function to move an ISO date by a number of days
+def shift_day(day, days):
+    return (date.fromisoformat(day) + timedelta(days=days)).isoformat()
+
+
+# Function to split each property's fetches into groups that fit in a single batch call
+# Batches are interleaved across properties so one property's shards do not queue up behind
+# its own throttle while other properties sit idle
+def batch_units(units, batch_size=MAX_BATCH_REPORTS):
+    by_property = {}
+    for unit in units:
+        by_property.setdefault(unit.property_id, []).append(unit)
+
+    property_batches = [[property_units[i:i + batch_size] for i in range(0, len(property_units), batch_size)]
+                        for property_units in by_property.values()]
+    return [batch for batches in zip_longest(*property_batches) for batch in batches if batch]
+
+
+# Function to fetch a batch of reports for one property, staging each page with its report's loader
+# and writing it to the response cache; returns (rows, fetch_id) for each unit, or None for a unit
+# whose pages did not all arrive
+def sync_batch(ga_client, loaders, cache, metrics, units, page_size):
+    property_id = units[0].property_id
+    names = ", ".join(f"{unit.report.name} {unit.fetch_start}..{unit.fetch_end}" for unit in units)
+    print(f"Fetching {names} for property ID: {property_id}")
+
+    requests = [build_report_request(unit.report, property_id, unit.fetch_start, unit.fetch_end) for unit in units]
+    fetch_ids = [uuid.uuid4().hex for _ in units]
+    staged_rows = [0] * len(units)
+    finished = [False] * len(units)
+    for unit in units:
+        unit.attempts += 1
+    try:
+        for page in iter_batch_report_pages(ga_client, property_id, requests, page_size=page_size):
+            for index, response, report_finished in page:
+                unit = units[index]
+                with metrics.stage("decode") as stage:
+                    df = response_to_frame(response, unit.report, property_id)
+                    stage.rows, stage.bytes = len(df), int(df.memory_usage().sum())
+                loaders[unit.report.name].add(df, fetch_ids[index])
+                if cache:
+                    with metrics.stage("cache_write") as stage:
+                        cache.put(cache.key(unit.report, property_id), fetch_ids[index], df, unit.report)
+                        stage.rows = len(df)
+                staged_rows[index] += len(df)
+                finished[index] = report_finished
+    except Exception as e:
+        print(f"Error fetching {names} for property ID {property_id}: {e}")
+        for unit, report_finished in zip(units, finished):
+            if not report_finished:
+                unit.error = f"{type(e).__name__}: {e}"
+
+    results = []
+    for unit, fetch_id, rows, report_finished in zip(units, fetch_ids, staged_rows, finished):
+        if cache:
+            key = cache.key(unit.report, property_id)
+            if report_finished:
+                cache.complete(key, fetch_id, unit.fetch_start, unit.fetch_end)
+            else:
+                cache.discard(key, fetch_id)
+        if report_finished:
+            print(f"Fetched {rows} {unit.report.name} rows for property ID {property_id}.")
+        results.append((rows, fetch_id) if report_finished else None)
+    return results
+
+
+# Function to fetch every unit the cache cannot serve, then fetch the ones that failed again,
+# each on its own, for up to shard_retries rounds; the journal is checkpointed after every round
+# Returns the units that still failed
+def fetch_units(ga_client, loaders, cache, metrics, journal, units, options):
+    pending = [unit for unit in units if not unit.loaded and unit.fetch_start is not None]
+    for attempt in range(options.shard_retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying {len(pending)} failed shards (retry {attempt} of {options.shard_retries}).")
+
+        batches = batch_units(pending, batch_size=MAX_BATCH_REPORTS if attempt == 0 else 1)
+        results = fetch_concurrently(sync_batch, [(ga_client, loaders, cache, metrics, batch, options.page_size)
+                                                  for batch in batches], max_workers=options.max_workers)
+        pending = []
+        for batch, batch_results in zip(batches, results):
+            for unit, result in zip(batch, batch_results):
+                if result is None:
+                    pending.append(unit)
+                    journal.record(unit, FAILED)
+                else:
+                    unit.rows, fetch_id = result
+                    unit.fetch_ids.append(fetch_id)
+                    unit.error = None
+                    journal.record(unit, FETCHED)
+        journal.save()
+    return pending
+
+
+# Function to stage the days of a unit outside its fetch window straight from the cache
+def serve_from_cache(cache, loaders, metrics, unit):
+    fetch_id = uuid.uuid4().hex
+    if unit.fetch_start is None:
+        ranges = [(unit.start_date, unit.end_date)]
+    else:
+        ranges = [(unit.start_date, shift_day(unit.fetch_start, -1)), (shift_day(unit.fetch_end, 1), unit.end_date)]
+
+    key = cache.key(unit.report, unit.property_id)
+    rows = 0
+    for start_date, end_date in ranges:
+        if start_date > end_date:
+            continue
+        with metrics.stage("cache_read") as stage:
+            table = cache.read(key, start_date, end_date)
+            if table is not None:
+                df = table.to_pandas(date_as_object=False)
+                stage.rows, stage.bytes = table.num_rows, table.nbytes
+        if table is not None:
+            loaders[unit.report.name].add(df, fetch_id)
+            rows += table.num_rows
+
+    if rows:
+        print(f"Served {rows} {unit.report.name} rows for property ID {unit.property_id} from the cache.")
+        unit.rows += rows
+        unit.fetch_ids.append(fetch_id)
+    return rows
+
+
+# Function to advance each property's watermark through its leading run of fetched shards
+# It stops at the first shard that failed, so the next run resumes from that shard. A shard that
+# came back empty still advances it: a property with no ad spend has nothing to fetch again
+def advance_watermarks(sync_state, report, units):
+    by_property = {}
+    for unit in sorted(units, key=lambda unit: unit.start_date):
+        by_property.setdefault(unit.property_id, []).append(unit)
+
+    for property_id, property_units in by_property.items():
+        for unit in property_units:
+            if not unit.fetched:
+                break
+            if unit.end_date > (get_watermark(sync_state, report.name, property_id) or ''):
+                set_watermark(sync_state, report.name, property_id, unit.end_date)
+
+
+# Function to plan the shards of a report for every property, starting from each property's watermark
+def plan_units(report, properties, sync_state, end_date, options):
+    units = []
+    for property_id in properties:
+        # Only fetch the days after each property's watermark, plus the look-back window
+        watermark = get_watermark(sync_state, report.name, property_id)
+        start_date = incremental_start_date(watermark, options.lookback_days, default_start=options.start_date,
+                                            full_refresh=options.full_refresh)
+        for shard_start, shard_end in date_shards(start_date, end_date, options.shard_by):
+            units.append(FetchUnit(report, property_id, shard_start, shard_end, shard_start, shard_end))
+    return units
+
+
+# Function to rebuild a report's shards from the journal of an interrupted run
+# Shards that run already loaded are kept, marked loaded, so watermarks can advance past them
+def resumed_units(report, journal):
+    units = []
+    for report_name, property_id, start_date, end_date, entry in journal.entries():
+        if report_name != report.name:
+            continue
+        unit = FetchUnit(report, property_id, start_date, end_date, start_date, end_date)
+        if entry["status"] == LOADED:
+            unit.loaded = unit.fetched = True
+            unit.rows = entry["rows"]
+        units.append(unit)
+    return units
+
+
+# Function to run a set of reports in one process, sharing the clients, dataset check and state
+# Each property's date range is split into shards, and every property's shards are fetched together
+# in batches, staged as the pages arrive, applied to each table in one transaction, and then the
+# watermarks are advanced. Days still fresh in the response cache are staged from it instead of
+# being requested again. Every shard's state is checkpointed in the run journal, and with
+# options.resume only the shards the last run did not load are run again.
+# Returns the shards that still failed after every retry; an empty list means a complete run
+def run(reports, ga_client, bq_client, communities, options, metrics=None):
+    metrics = metrics or RunMetrics()
+    retry = RetryPolicy.from_options(options, metrics)
+    dataset_id = ensure_dataset(bq_client, bq_client.project)
+    properties = property_index(communities)
+    sync_communities(bq_client, dataset_id, communities)
+    print(f"Fetching {len(properties)} properties for {len(communities)} communities.")
+    sync_state = load_state(options.state_path)
+    cache = None
+    if not options.no_cache:
+        cache = ResponseCache(options.cache_path, ttl_hours=options.cache_ttl_hours, max_mb=options.cache_max_mb)
+    run_started = datetime.now()
+    end_date = options.end_date or run_started.strftime('%Y-%m-%d')  # Default end_date to today's date
+
+    previous = RunJournal.load(options.journal_path)
+    resuming = options.resume and previous is not None and previous.unfinished()
+    if resuming:
+        journal = previous
+        end_date = journal.end_date
+        print(f"Resuming run {journal.run_id} through {end_date}.")
+    else:
+        if options.resume:
+            print("The last run has nothing left to resume; starting a new run.")
+        journal = RunJournal.start(options.journal_path, end_date)
+        # The watermarks already moved past rows whose rollups a failed run never rebuilt; carry them over
+        if previous is not None:
+            for report_name, (first_day, last_day) in previous.rollup_spans().items():
+                journal.add_rollup_span(report_name, first_day, last_day)
+
+    loaders = {}
+    units = []
+    for report in reports:
+        table_id = ensure_table(bq_client, report, dataset_id)
+        if options.compact:
+            compact_table(bq_client, report, table_id, metrics=metrics, retry=retry)
+        loaders[report.name] = StagedLoader(bq_client, table_id, report.schema, key_column=report.key_column,
+                                            date_column=report.date_column,
+                                            export_path=export_path(options.export_dir, report, run_started),
+                                            metrics=metrics, retry=retry, flush_rows=options.flush_rows,
+                                            flush_mb=options.flush_mb, queue_size=options.queue_size)
+        ensure_community_view(bq_client, report, dataset_id)
+
+        if resuming:
+            report_units = resumed_units(report, journal)
+        else:
+            report_units = plan_units(report, properties, sync_state, end_date, options)
+        for unit in report_units:
+            if unit.loaded:
+                continue
+            if cache:
+                window = cache.fetch_window(cache.key(report, unit.property_id), unit.start_date, unit.end_date)
+                unit.fetch_start, unit.fetch_end = window or (None, None)
+            journal.record(unit, PENDING)
+        units.extend(report_units)
+    journal.save()
+
+    failed = fetch_units(ga_client, loaders, cache, metrics, journal, units, options)
+    if failed:
+        print(f"{len(failed)} shards could not be fetched; their old rows are kept.")
+
+    # A unit counts as fetched once its whole fetch window arrived; the cache fills in the rest
+    failed_ids = {id(unit) for unit in failed}
+    for unit in units:
+        if unit.loaded or id(unit) in failed_ids:
+            continue
+        unit.fetched = True
+        if cache:
+            serve_from_cache(cache, loaders, metrics, unit)
+
+    for report in reports:
+        print(f"Processing report: {report.name}")
+        report_units = [unit for unit in units if unit.report is report]
+
+        # Apply every shard that was fetched completely, even an empty one, whose window is then cleared;
+        # shards that failed keep their old rows
+        loaded_units = [unit for unit in report_units if unit.fetched and not unit.loaded]
+        fetch_ids = [fetch_id for unit in loaded_units for fetch_id in unit.fetch_ids]
+        if report.key_column:
+            loaders[report.name].commit([(unit.property_id, unit.start_date, unit.end_date) for unit in loaded_units],
+                                        fetch_ids=fetch_ids)
+        else:
+            loaders[report.name].commit(fetch_ids=fetch_ids)
+
+        advance_watermarks(sync_state, report, report_units)
+        save_report_state(report.name, sync_state.get(report.name, {}), options.state_path)
+
+        # Checkpoint the report: every fetched shard's window now holds exactly its fetched rows, and
+        # the rollup periods over those windows are owed a rebuild until refresh_rollups succeeds
+        for unit in report_units:
+            if unit.fetched and not unit.loaded:
+                unit.loaded = True
+                journal.record(unit, LOADED)
+        if loaded_units:
+            journal.add_rollup_span(report.name, min(unit.start_date for unit in loaded_units),
+                                    max(unit.end_date for unit in loaded_units))
+        journal.save()
+
+    # Rebuild the rollup periods the refreshed windows fall in, including any an earlier run left
+    # pending, or every period with --rebuild-rollups
+    touched = history_spans(bq_client, dataset_id) if options.rebuild_rollups else journal.rollup_spans()
+    refresh_rollups(bq_client, dataset_id, touched, metrics=metrics, retry=retry)
+    journal.clear_rollups()
+
+    journal.finish()
+    if cache:
+        cache.evict()
+        cache.close()
+
+    if failed:
+        print(f"Processing finished with {len(failed)} shards not loaded; run again with --resume to retry them.")
+    else:
+        print("Processing complete.")
+    return failed
+
+
+# Function to load every Parquet export under replay_dir back into BigQuery, oldest first,
+# without calling GA4 or moving any watermark
+def replay(reports, bq_client, replay_dir, metrics=None):
+    retry = RetryPolicy(metrics=metrics)
+    dataset_id = ensure_dataset(bq_client, bq_client.project)
+    touched = {}
+    for report in reports:
+        table_id = ensure_table(bq_client, report, dataset_id)
+        for path in sorted(glob.glob(os.path.join(replay_dir, report.name, '*.parquet'))):
+            print(f"Replaying {path} into {table_id}")
+            replay_export(bq_client, table_id, report.schema, path, key_column=report.key_column,
+                          date_column=report.date_column, metrics=metrics, retry=retry)
+            span = export_span(path, report.date_column)
+            if span:
+                first_day, last_day = touched.get(report.name, span)
+                touched[report.name] = (min(first_day, span[0]), max(last_day, span[1]))
+    refresh_rollups(bq_client, dataset_id, touched, metrics=metrics, retry=retry)
+
+    print("Replay complete.")
@@ -0,0 +1,278 @@
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+
+from .communities import property_index
+from .fetch import ThrottledAnalyticsClient
+from .journal import RunJournal
+from .metrics import InstrumentedAnalyticsClient, RunMetrics
+from .reports import REPORTS
+from .retry import RetryPolicy
+from .rollups import ROLLUPS, period_end, period_start
+from .runner import run
+from .state import get_watermark, incremental_start_date, load_state
+
+# Settled history is refreshed once a day; today's figures every hour for the reports that ask for them
+DEFAULT_SETTLED_CADENCE_MINUTES = 24 * 60
+DEFAULT_INTRADAY_CADENCE_MINUTES = 60
+DEFAULT_INTRADAY_REPORTS = ("SessionData",)
+
+# Jobs that may run at once, and how often the scheduler looks for due jobs
+DEFAULT_MAX_JOBS = 2
+DEFAULT_POLL_SECONDS = 30
+
+# A failed job is tried again after this many minutes, doubling with each failure up to its cadence
+DEFAULT_FAILURE_BACKOFF_MINUTES = 5
+
+# Hourly token quota of a standard GA4 property, and the tokens a property must have left for a job to start
+GA4_TOKENS_PER_HOUR = 40000
+DEFAULT_QUOTA_FLOOR = 2000
+
+
+# One report refreshed on its own cadence; intraday jobs fetch only today, settled jobs everything before it
+@dataclass
+class ScheduledJob:
+    name: str
+    report: object
+    cadence_minutes: float
+    intraday: bool = False
+    next_due: float = 0.0
+    failures: int = 0
+    runs: int = 0
+    last_error: str = None
+    last_finished_at: str = None
+    claims: list = field(default_factory=list)
+
+
+# Function to build the default jobs: a settled job for every report and an intraday job for some of them
+# cadences maps a job name ("SessionData" or "SessionData:intraday") to minutes, overriding the defaults
+def build_jobs(reports, intraday_reports=DEFAULT_INTRADAY_REPORTS, cadences=None,
+               settled_minutes=DEFAULT_SETTLED_CADENCE_MINUTES, intraday_minutes=DEFAULT_INTRADAY_CADENCE_MINUTES):
+    cadences = cadences or {}
+    jobs = []
+    for report in reports:
+        jobs.append(ScheduledJob(report.name, report, cadences.get(report.name, settled_minutes)))
+        if report.name in intraday_reports and intraday_minutes:
+            name = f"{report.name}:intraday"
+            jobs.append(ScheduledJob(name, report, cadences.get(name, intraday_minutes), intraday=True))
+    return jobs
+
+
+# Function to derive a per-job file path from a shared one, e.g. run_journal.json -> run_journal.SessionData.json
+def job_path(path, job_name):
+    root, extension = os.path.splitext(path)
+    return f"{root}.{job_name.replace(':', '-')}{extension}"
+
+
+# Function to tell whether two claimed (table, first_day, last_day) ranges touch the same partition
+def claims_overlap(claim, other):
+    return claim[0] == other[0] and claim[1] <= other[2] and other[1] <= claim[2]
+
+
+# Long-running scheduler that runs each job on its cadence with one set of warm GA4 and BigQuery clients
+# ga_client is the bare GA4 client; the scheduler throttles it per property across all jobs
+# Due jobs are started in order of freshness lag weighted by the GA4 quota their properties have left,
+# a job whose properties are nearly out of hourly or daily quota waits, and no two jobs that would
+# write the same table partition (report or rollup) ever run at once
+class Scheduler:
+    def __init__(self, jobs, ga_client, bq_client, communities, options, metrics=None,
+                 max_jobs=DEFAULT_MAX_JOBS, poll_seconds=DEFAULT_POLL_SECONDS, quota_floor=DEFAULT_QUOTA_FLOOR,
+                 clock=time.monotonic, sleep=time.sleep, today=date.today):
+        self.jobs = jobs
+        self.ga_client = ga_client
+        self.throttle = ThrottledAnalyticsClient(ga_client, requests_per_second=options.requests_per_second,
+                                                 burst=options.burst)
+        self.bq_client = bq_client
+        self.communities = communities
+        self.properties = sorted(property_index(communities))
+        self.options = options
+        self.metrics = metrics or RunMetrics()
+        self.max_jobs = max_jobs
+        self.poll_seconds = poll_seconds
+        self.quota_floor = quota_floor
+        self.clock = clock
+        self.sleep = sleep
+        self.today = today
+        self.running = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+
+    # Function to build the run options of one job from the daemon's options
+    # Every job keeps its own journal and run report. After a job crashed its next run resumes the
+    # journal; shards that merely failed are fetched again anyway, since their watermarks stay put
+    def job_options(self, job):
+        options = copy.copy(self.options)
+        options.journal_path = job_path(self.options.journal_path, job.name)
+        options.run_report_path = job_path(self.options.run_report_path, job.name)
+        options.openmetrics_path = self.options.openmetrics_path and job_path(self.options.openmetrics_path, job.name)
+        options.resume = job.failures > 0
+        options.compact = False
+        options.rebuild_rollups = False
+        today = self.today()
+        if job.intraday:
+            # Today is still changing: fetch it whole, skip the cache and keep the settled watermarks untouched
+            options.start_date = options.end_date = today.isoformat()
+            options.full_refresh = True
+            options.no_cache = True
+            options.shard_by = 'none'
+            options.state_path = job_path(self.options.state_path, job.name)
+        else:
+            options.end_date = (today - timedelta(days=1)).isoformat()
+        return options
+
+    # Function to list the (table, first_day, last_day) ranges a job will rewrite: its report's refreshed
+    # days and the periods of every rollup that report feeds
+    def claims(self, job, options):
+        journal = RunJournal.load(options.journal_path) if options.resume else None
+        if journal is not None and journal.unfinished():
+            # A resumed job rewrites its unloaded shards and rebuilds the rollups it still owes
+            spans = [(start_date, end_date) for _, _, start_date, end_date, _ in journal.entries()]
+            spans += list(journal.rollup_spans().values())
+            first_day = min(first for first, _ in spans)
+            last_day = max([journal.end_date] + [last for _, last in spans])
+        else:
+            state = load_state(options.state_path)
+            first_day = min((incremental_start_date(get_watermark(state, job.report.name, property_id),
+                                                    options.lookback_days, default_start=options.start_date,
+                                                    full_refresh=options.full_refresh)
+                             for property_id in self.properties), default=options.start_date)
+            last_day = options.end_date
+        claims = [(job.report.table_name, first_day, last_day)]
+        for rollup in ROLLUPS.values():
+            if job.report.name in rollup.sources:
+                claims.append((rollup.table_name,
+                               period_start(date.fromisoformat(first_day), rollup.grain).isoformat(),
+                               period_end(date.fromisoformat(last_day), rollup.grain).isoformat()))
+        return claims
+
+    # Function to find the share of hourly GA4 quota the most constrained property has left
+    # A property last seen in an earlier hour is treated as having its full quota back; None means
+    # a property is below the floor of hourly or daily tokens and every job has to wait
+    def quota_headroom(self):
+        now = datetime.now(timezone.utc)
+        this_hour = now.replace(minute=0, second=0, microsecond=0)
+        headroom = 1.0
+        for quota in self.metrics.quota_snapshot().values():
+            observed_at = quota["observed_at"]
+            if observed_at.date() == now.date() and quota["tokens_per_day_remaining"] < self.quota_floor:
+                return None
+            if observed_at < this_hour:
+                continue
+            if quota["tokens_per_hour_remaining"] < self.quota_floor:
+                return None
+            headroom = min(headroom, quota["tokens_per_hour_remaining"] / GA4_TOKENS_PER_HOUR)
+        return headroom
+
+    # Function to score a due job: how many cadences overdue it is, discounted by the days it will
+    # fetch as quota runs short, so a long backfill gives way to short refreshes when tokens are scarce
+    # Intraday jobs win ties, since today's figures go stale fastest
+    def priority(self, job, claims, now, headroom):
+        lag = 1 + (now - job.next_due) / (job.cadence_minutes * 60)
+        _, first_day, last_day = claims[0]
+        days = (date.fromisoformat(last_day) - date.fromisoformat(first_day)).days + 1
+        return (lag / (1 + (1 - headroom) * days), job.intraday)
+
+    # Function to start every due job that fits, highest priority first
+    def tick(self):
+        now = self.clock()
+        headroom = self.quota_headroom()
+        if headroom is None:
+            print("GA4 quota is nearly used up for a property; holding every job until it recovers.")
+            return []
+
+        with self.lock:
+            due = [job for job in self.jobs if job.next_due <= now and job.name not in self.running]
+        candidates = []
+        for job in due:
+            options = self.job_options(job)
+            claims = self.claims(job, options)
+            candidates.append((self.priority(job, claims, now, headroom), job, options, claims))
+
+        started = []
+        for _, job, options, claims in sorted(candidates, key=lambda candidate: candidate[0], reverse=True):
+            with self.lock:
+                if len(self.running) >= self.max_jobs:
+                    break
+                held = [claim for running in self.running.values() for claim in running]
+                if any(claims_overlap(claim, other) for claim in claims for other in held):
+                    print(f"Holding {job.name}: another job is writing the same partitions.")
+                    continue
+                self.running[job.name] = claims
+                job.claims = claims
+            self.executor.submit(self._run_job, job, options)
+            started.append(job.name)
+        return started
+
+    def _run_job(self, job, options):
+        print(f"Starting {job.name} ({options.start_date if job.intraday else 'incremental'} to {options.end_date}).")
+        job_metrics = RunMetrics()
+        # The job's GA4 calls, quota and retries go into its own run report; quota readings also reach
+        # the scheduler's metrics, which it reads for headroom
+        ga_client = self.throttle.sharing_limits(
+            InstrumentedAnalyticsClient(self.ga_client, job_metrics, quota_metrics=self.metrics),
+            retry=RetryPolicy.from_options(options, job_metrics))
+        try:
+            failed = run([job.report], ga_client, self.bq_client, self.communities, options, metrics=job_metrics)
+            if failed:
+                # Shards that failed are retried on the backoff schedule, resuming the job's journal
+                raise RuntimeError(f"{len(failed)} shards could not be fetched")
+            job.failures = 0
+            job.last_error = None
+            job.next_due = self.clock() + job.cadence_minutes * 60
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            backoff = min(job.cadence_minutes, DEFAULT_FAILURE_BACKOFF_MINUTES * 2 ** (job.failures - 1))
+            job.next_due = self.clock() + backoff * 60
+            print(f"Job {job.name} failed ({e}); retrying in {backoff:.0f} minutes.")
+        finally:
+            job.runs += 1
+            job.last_finished_at = datetime.now(timezone.utc).isoformat()
+            job_metrics.write(options.run_report_path, options.openmetrics_path)
+            with self.lock:
+                self.running.pop(job.name, None)
+
+    # Function to run the scheduler until interrupted, or for max_ticks polls when given
+    def run_forever(self, max_ticks=None):
+        print(f"Scheduling {len(self.jobs)} jobs: "
+              + ", ".join(f"{job.name} every {job.cadence_minutes:g} min" for job in self.jobs))
+        ticks = 0
+        try:
+            while max_ticks is None or ticks < max_ticks:
+                self.tick()
+                ticks += 1
+                self.sleep(self.poll_seconds)
+        except KeyboardInterrupt:
+            print("Stopping the scheduler after the running jobs finish.")
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+# Function to parse a --cadence value of the form JOB=MINUTES
+def parse_cadence(value):
+    name, _, minutes = value.partition('=')
+    report_name = name.split(':')[0]
+    if report_name not in REPORTS or not minutes:
+        raise ValueError(f"Expected REPORT=MINUTES or REPORT:intraday=MINUTES, got {value!r}")
+    return name, float(minutes)
+
+
+# Function to add the scheduler options to the CLI
+def add_scheduler_arguments(parser):
+    parser.add_argument('--schedule', action='store_true',
+                        help="Run as a long-lived scheduler that refreshes every report on its own cadence")
+    parser.add_argument('--cadence', action='append', default=[], metavar='JOB=MINUTES',
+                        help="Override a job's cadence, e.g. WebEventData=720 or SessionData:intraday=30")
+    parser.add_argument('--intraday-reports', nargs='*', choices=sorted(REPORTS), default=list(DEFAULT_INTRADAY_REPORTS),
+                        help="Reports that also get an intraday job refreshing today's figures")
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS,
+                        help="Scheduled jobs that may run at once")
+    parser.add_argument('--poll-seconds', type=float, default=DEFAULT_POLL_SECONDS,
+                        help="How often the scheduler looks for due jobs")
+    parser.add_argument('--quota-floor', type=int, default=DEFAULT_QUOTA_FLOOR,
+                        help="GA4 tokens a property must have left in the hour and day before a job starts")
+    return parser
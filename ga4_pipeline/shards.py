@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+
+# How a property's date range is split into separately fetched shards
+SHARD_CHOICES = ('month', 'week', 'none')
+DEFAULT_SHARD_BY = 'month'
+
+# Rounds in which shards that failed are fetched again, each shard on its own
+DEFAULT_SHARD_RETRIES = 2
+
+
+# Function to split start_date..end_date into calendar-aligned shards, oldest first
+# Weeks start on Monday; 'none' keeps the whole range as a single shard
+def date_shards(start_date, end_date, shard_by=DEFAULT_SHARD_BY):
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    if shard_by == 'none':
+        return [(start_date, end_date)]
+
+    shards = []
+    while start <= end:
+        if shard_by == 'week':
+            next_start = start + timedelta(days=7 - start.weekday())
+        else:
+            next_start = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        shard_end = min(next_start - timedelta(days=1), end)
+        shards.append((start.isoformat(), shard_end.isoformat()))
+        start = next_start
+    return shards
+
+
+# Function to add the backfill sharding options to the CLI
+def add_shard_arguments(parser):
+    parser.add_argument('--shard-by', choices=SHARD_CHOICES, default=DEFAULT_SHARD_BY,
+                        help="Split each property's date range into monthly or weekly shards fetched in parallel")
+    parser.add_argument('--shard-retries', type=int, default=DEFAULT_SHARD_RETRIES,
+                        help="Times a failed shard is fetched again on its own before the run gives up on it")
+    return parser
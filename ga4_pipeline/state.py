@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+# Default location of the local high-water mark store
+DEFAULT_STATE_PATH = 'sync_state.json'
+
+# GA4 keeps revising recent days for a while, so re-fetch this many days before the mark
+DEFAULT_LOOKBACK_DAYS = 3
+
+# Earliest date any report is backfilled from
+DEFAULT_START_DATE = "2024-01-01"
+
+
+# Function to read the state store, returning an empty store if it does not exist yet
+def load_state(path=DEFAULT_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Function to write the state store atomically so a crash never leaves a half-written file
+def save_state(state, path=DEFAULT_STATE_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Guards the read-modify-write in save_report_state when several runs share a process
+_state_lock = threading.Lock()
+
+
+# Function to write one report's watermarks into the state store, leaving every other report's as stored
+# Runs of different reports can then share one state file without overwriting each other's marks
+def save_report_state(report_name, marks, path=DEFAULT_STATE_PATH):
+    with _state_lock:
+        state = load_state(path)
+        state[report_name] = marks
+        save_state(state, path)
+
+
+# Function to get the last fully loaded date for a report and property
+def get_watermark(state, report_name, property_id):
+    return state.get(report_name, {}).get(str(property_id))
+
+
+# Function to record the last fully loaded date for a report and property
+def set_watermark(state, report_name, property_id, loaded_through):
+    state.setdefault(report_name, {})[str(property_id)] = loaded_through
+
+
+# Function to work out where a property's fetch window should start
+def incremental_start_date(watermark, lookback_days=DEFAULT_LOOKBACK_DAYS,
+                           default_start=DEFAULT_START_DATE, full_refresh=False):
+    if full_refresh or watermark is None:
+        return default_start
+
+    start = datetime.strptime(watermark, '%Y-%m-%d') - timedelta(days=lookback_days)
+    return max(start.strftime('%Y-%m-%d'), default_start)
+
+
+# Function to add the incremental sync options to the CLI
+def add_sync_arguments(parser):
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Ignore the stored watermarks and re-backfill from --start-date")
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                        help="Days before the watermark to re-fetch for late-arriving GA4 data")
+    parser.add_argument('--state-path', default=DEFAULT_STATE_PATH,
+                        help="Path of the local watermark state file")
+    parser.add_argument('--start-date', default=DEFAULT_START_DATE,
+                        help="First date a property without a watermark is backfilled from")
+    parser.add_argument('--end-date',
+                        help="Last date to fetch (default: today)")
+    return parser
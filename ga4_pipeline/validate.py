@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from .config import BQ_KEY_PATH, COMMUNITIES, DATASET_NAME, GA_KEY_PATH
+from .reports import REPORTS
+from .rollups import ROLLUPS
+from .shards import add_shard_arguments, date_shards
+from .state import add_sync_arguments, get_watermark, incremental_start_date, load_state
+
+# Default location of the local copy of GA4's dimension and metric metadata, and how long it is trusted
+DEFAULT_METADATA_PATH = 'ga4_metadata.json'
+DEFAULT_METADATA_TTL_HOURS = 24 * 7
+
+# BigQuery field types a report or rollup may declare; the loader has an Arrow type for each
+FIELD_TYPES = ("STRING", "INTEGER", "FLOAT", "BOOLEAN", "DATE", "DATETIME", "TIMESTAMP")
+
+# GA4 accepts at most this many dimensions and metrics in one report request
+MAX_DIMENSIONS = 9
+MAX_METRICS = 10
+
+# BigQuery clusters a table on at most four columns
+MAX_CLUSTER_COLUMNS = 4
+
+# Dataset and table names BigQuery accepts
+NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+# Collects the findings of a validation run, printing each one as it is found
+class Findings:
+    def __init__(self):
+        self.errors = 0
+        self.warnings = 0
+
+    def ok(self, message):
+        print(f"ok       {message}")
+
+    def warning(self, message):
+        self.warnings += 1
+        print(f"WARNING  {message}")
+
+    def error(self, message):
+        self.errors += 1
+        print(f"ERROR    {message}")
+
+
+# Function to check the community map, the key files and the dataset name
+def check_config(findings, communities, options):
+    if not communities:
+        findings.error("COMMUNITIES is empty; there is nothing to fetch")
+    for community_name, property_id in sorted(communities.items()):
+        if not str(property_id).isdigit():
+            findings.error(f"Community {community_name!r} has property ID {property_id!r}, which is not numeric")
+    properties = set(communities.values())
+    findings.ok(f"{len(communities)} communities on {len(properties)} GA4 properties")
+
+    if not os.path.exists(options.ga_key_path):
+        findings.warning(f"GA4 key {options.ga_key_path} not found; runs cannot authenticate")
+    if not os.path.exists(options.bq_key_path):
+        findings.ok(f"BigQuery key {options.bq_key_path} not found; BigQuery will use the GA4 key")
+    if not NAME_PATTERN.match(DATASET_NAME):
+        findings.error(f"Dataset name {DATASET_NAME!r} is not a valid BigQuery dataset name")
+
+
+# Function to check that a table definition is internally consistent
+def check_table_definition(findings, definition):
+    columns = [name for name, _ in definition.schema]
+    types = dict(definition.schema)
+    problems = findings.errors
+    if not NAME_PATTERN.match(definition.table_name):
+        findings.error(f"{definition.table_name}: not a valid BigQuery table name")
+    for name in sorted({name for name in columns if columns.count(name) > 1}):
+        findings.error(f"{definition.table_name}: column {name} is declared twice")
+    for name, field_type in definition.schema:
+        if field_type not in FIELD_TYPES:
+            findings.error(f"{definition.table_name}: column {name} has unsupported type {field_type}")
+    if types.get(definition.date_column) != "DATE":
+        findings.error(f"{definition.table_name}: date column {definition.date_column} must be a DATE column")
+    for name in (definition.key_column,) if getattr(definition, 'key_column', None) else ():
+        if name not in types:
+            findings.error(f"{definition.table_name}: key column {name} is not in the schema")
+    for name in definition.cluster_columns:
+        if name not in types:
+            findings.error(f"{definition.table_name}: cluster column {name} is not in the schema")
+    if len(definition.cluster_columns) > MAX_CLUSTER_COLUMNS:
+        findings.error(f"{definition.table_name}: BigQuery clusters on at most {MAX_CLUSTER_COLUMNS} columns")
+    return findings.errors == problems
+
+
+# Function to check every report and rollup definition without calling any API
+def check_definitions(findings, reports):
+    for report in reports:
+        valid = check_table_definition(findings, report)
+        types = dict(report.schema)
+        for ga4_name in report.dimensions + report.metrics:
+            if report.column_for(ga4_name) not in types:
+                findings.error(f"{report.name}: {ga4_name} has no column in the schema")
+                valid = False
+        if len(report.dimensions) > MAX_DIMENSIONS or len(report.metrics) > MAX_METRICS:
+            findings.error(f"{report.name}: GA4 allows at most {MAX_DIMENSIONS} dimensions and {MAX_METRICS} metrics")
+            valid = False
+        if valid:
+            findings.ok(f"{report.name}: {len(report.dimensions)} dimensions, {len(report.metrics)} metrics, "
+                        f"{len(report.schema)} columns")
+
+    for rollup in ROLLUPS.values():
+        valid = check_table_definition(findings, rollup)
+        for source in rollup.sources:
+            if source not in REPORTS:
+                findings.error(f"{rollup.table_name}: source report {source} does not exist")
+                valid = False
+        source_columns = {name for source in rollup.sources if source in REPORTS
+                          for name, _ in REPORTS[source].schema}
+        for name, _ in rollup.group_columns:
+            if name not in source_columns:
+                findings.error(f"{rollup.table_name}: group column {name} is in none of its source reports")
+                valid = False
+        if valid:
+            findings.ok(f"{rollup.table_name}: from {', '.join(rollup.sources)}")
+
+
+# Function to fetch one property's dimension and metric metadata from GA4
+def fetch_property_metadata(ga_client, property_id):
+    metadata = ga_client.get_metadata(name=f"properties/{property_id}/metadata")
+    return {
+        "dimensions": sorted(dimension.api_name for dimension in metadata.dimensions),
+        "metrics": {metric.api_name: metric.type_.name for metric in metadata.metrics},
+    }
+
+
+# Function to load the GA4 metadata of every property, from the local copy while it is fresh
+# Missing or stale properties are fetched (never report data) and written back to the local copy
+def load_metadata(findings, property_ids, options):
+    cached = {}
+    if os.path.exists(options.metadata_path):
+        with open(options.metadata_path) as f:
+            cached = json.load(f)
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=options.metadata_ttl_hours)
+    stale = [property_id for property_id in property_ids
+             if options.refresh_metadata or property_id not in cached
+             or datetime.fromisoformat(cached[property_id]["fetched_at"]) < cutoff]
+    if stale and options.offline:
+        findings.warning(f"No fresh GA4 metadata cached for {len(stale)} properties; skipping them (--offline)")
+        return {property_id: cached[property_id] for property_id in property_ids if property_id in cached}
+    if stale:
+        # Only now are the GA4 client libraries imported and authenticated
+        from .clients import build_analytics_client
+
+        fetched = []
+        try:
+            ga_client, _ = build_analytics_client(options.ga_key_path)
+            for property_id in stale:
+                cached[property_id] = dict(fetch_property_metadata(ga_client, property_id),
+                                           fetched_at=datetime.now(timezone.utc).isoformat())
+                fetched.append(property_id)
+        except Exception as e:
+            findings.error(f"Could not fetch GA4 metadata after {len(fetched)} of {len(stale)} properties: {e}")
+        else:
+            findings.ok(f"Fetched GA4 metadata for {len(fetched)} properties into {options.metadata_path}")
+
+        # Keep whatever was fetched, so a retry only asks for the properties still missing
+        if fetched:
+            tmp_path = f"{options.metadata_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cached, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, options.metadata_path)
+    return {property_id: cached[property_id] for property_id in property_ids if property_id in cached}
+
+
+# Function to check every report's dimensions and metrics against each property's GA4 metadata
+# Integer columns need GA4 integer metrics; anything else would be rounded on load
+def check_metadata(findings, reports, metadata):
+    for property_id, property_metadata in sorted(metadata.items()):
+        dimensions = set(property_metadata["dimensions"])
+        metrics = property_metadata["metrics"]
+        problems = findings.errors
+        for report in reports:
+            for name in report.dimensions:
+                if name not in dimensions:
+                    findings.error(f"{report.name}: property {property_id} has no dimension {name}")
+            for name in report.metrics:
+                if name not in metrics:
+                    findings.error(f"{report.name}: property {property_id} has no metric {name}")
+                elif report.field_type(report.column_for(name)) == "INTEGER" and metrics[name] != "TYPE_INTEGER":
+                    findings.error(f"{report.name}: {name} is {metrics[name]} on property {property_id} "
+                                   "but lands in an INTEGER column")
+        if findings.errors == problems:
+            findings.ok(f"Property {property_id}: every report field exists in GA4 with a compatible type")
+
+
+# Function to compare the live BigQuery tables with the report definitions, reading only table metadata
+def check_tables(findings, reports, options):
+    from google.api_core.exceptions import NotFound
+
+    from .clients import build_clients, has_partitioning, table_layout
+
+    _, bq_client = build_clients(options.ga_key_path, options.bq_key_path)
+    dataset_id = f"{bq_client.project}.{DATASET_NAME}"
+    for definition in list(reports) + list(ROLLUPS.values()):
+        table_id = definition.table_id(dataset_id)
+        try:
+            table = bq_client.get_table(table_id)
+        except NotFound:
+            findings.ok(f"{table_id}: does not exist yet and will be created")
+            continue
+
+        existing = {field.name: field.field_type for field in table.schema}
+        problems = findings.errors + findings.warnings
+        for name, field_type in definition.schema:
+            if name not in existing:
+                findings.warning(f"{table_id}: column {name} is missing and will be added")
+            elif existing[name] not in (field_type, {"INTEGER": "INT64", "FLOAT": "FLOAT64"}.get(field_type)):
+                findings.error(f"{table_id}: column {name} is {existing[name]}, expected {field_type}")
+        if not has_partitioning(table, definition):
+            findings.warning(f"{table_id}: not partitioned by day on {definition.date_column}; it will be migrated")
+        elif (table.clustering_fields or None) != table_layout(definition)[1]:
+            findings.warning(f"{table_id}: clustering will change to {', '.join(definition.cluster_columns)}")
+        if findings.errors + findings.warnings == problems:
+            findings.ok(f"{table_id}: schema and layout match")
+
+
+# Function to print what a run would fetch from the stored watermarks, without fetching it
+def print_plan(reports, property_ids, options):
+    end_date = options.end_date or date.today().isoformat()
+    state = load_state(options.state_path)
+    for report in reports:
+        starts = [incremental_start_date(get_watermark(state, report.name, property_id), options.lookback_days,
+                                         default_start=options.start_date, full_refresh=options.full_refresh)
+                  for property_id in property_ids]
+        shards = sum(len(date_shards(start_date, end_date, options.shard_by)) for start_date in starts)
+        if starts:
+            print(f"plan     {report.name}: {len(starts)} properties from {min(starts)} "
+                  f"(latest {max(starts)}) to {end_date}, {shards} shards")
+
+
+# Function to build the parser of the validate command
+def build_validate_parser():
+    parser = argparse.ArgumentParser(prog="ga4_pipeline validate",
+                                     description="Check the configuration, report definitions and target schemas "
+                                                 "without fetching any data")
+    parser.add_argument('--reports', nargs='+', choices=sorted(REPORTS), default=list(REPORTS),
+                        help="Reports to check (default: all)")
+    parser.add_argument('--ga-key-path', default=GA_KEY_PATH,
+                        help="Service account key for Google Analytics")
+    parser.add_argument('--bq-key-path', default=BQ_KEY_PATH,
+                        help="Service account key for BigQuery (falls back to the GA key)")
+    parser.add_argument('--metadata-path', default=DEFAULT_METADATA_PATH,
+                        help="Local copy of each property's GA4 dimension and metric metadata")
+    parser.add_argument('--metadata-ttl-hours', type=float, default=DEFAULT_METADATA_TTL_HOURS,
+                        help="Age after which a property's cached metadata is fetched again")
+    parser.add_argument('--refresh-metadata', action='store_true',
+                        help="Fetch the GA4 metadata of every property even if the local copy is fresh")
+    parser.add_argument('--offline', action='store_true',
+                        help="Never call GA4; check only against the metadata already cached")
+    parser.add_argument('--check-tables', action='store_true',
+                        help="Also compare the live BigQuery tables with the definitions (reads table metadata only)")
+    add_sync_arguments(parser)
+    add_shard_arguments(parser)
+    return parser
+
+
+# Entry point of `python -m ga4_pipeline validate`; returns 1 when any check failed
+def validate_main(argv=None):
+    options = build_validate_parser().parse_args(argv)
+    reports = [REPORTS[name] for name in options.reports]
+    property_ids = sorted({str(property_id) for property_id in COMMUNITIES.values()})
+    findings = Findings()
+
+    check_config(findings, COMMUNITIES, options)
+    check_definitions(findings, reports)
+    check_metadata(findings, reports, load_metadata(findings, property_ids, options))
+    if options.check_tables:
+        check_tables(findings, reports, options)
+    print_plan(reports, property_ids, options)
+
+    print(f"{findings.errors} errors, {findings.warnings} warnings.")
+    return 1 if findings.errors else 0
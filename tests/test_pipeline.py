@@ -0,0 +1,140 @@
+from google.api_core.exceptions import PermissionDenied
+from google.cloud import bigquery
+
+from ga4_pipeline.cli import build_parser
+from ga4_pipeline.fake_bigquery import FakeBigQueryClient
+from ga4_pipeline.fake_ga4 import FakeAnalyticsDataClient
+from ga4_pipeline.journal import RunJournal
+from ga4_pipeline.reports import AD_DATA, REPORTS, SESSION_DATA
+from ga4_pipeline.runner import run
+from ga4_pipeline.state import load_state
+
+COMMUNITIES = {"Community A": "111", "Community B": "111", "Community C": "222"}
+DATASET_ID = "fake-project.combined"
+
+
+# Fake GA4 client that records the date range of every report request, and fails every request for
+# the properties in failing_properties with an error the retry policy does not retry
+class RecordingAnalyticsClient(FakeAnalyticsDataClient):
+    def __init__(self, failing_properties=()):
+        super().__init__(rows_per_day=3, cardinality=2)
+        self.failing_properties = set(failing_properties)
+        self.ranges = []
+
+    def _build_response(self, request):
+        property_id = request.property.split('/')[-1]
+        if property_id in self.failing_properties:
+            raise PermissionDenied(f"injected failure for {request.property}")
+        date_range = request.date_ranges[0]
+        with self.lock:
+            self.ranges.append((property_id, date_range.start_date, date_range.end_date))
+        return super()._build_response(request)
+
+
+# Function to parse the pipeline options for a run whose state, journal, cache and reports live in tmp_path
+def pipeline_options(tmp_path, *args):
+    return build_parser().parse_args([
+        '--state-path', str(tmp_path / 'state.json'),
+        '--journal-path', str(tmp_path / 'journal.json'),
+        '--cache-path', str(tmp_path / 'cache.sqlite'),
+        '--run-report-path', str(tmp_path / 'run_report.json'),
+        '--start-date', '2024-01-01',
+        '--shard-retries', '0',
+        '--retries', '0',
+    ] + list(args))
+
+
+# Function to read the identifying columns of every row in a report table
+def row_keys(bq_client, report):
+    return [tuple(row[column] for column in [report.date_column] + report.row_key_columns())
+            for row in bq_client.fetch_rows(report.table_id(DATASET_ID))]
+
+
+def test_incremental_rerun_fetches_only_new_days_and_replaces_rows(tmp_path):
+    ga_client = RecordingAnalyticsClient()
+    bq_client = FakeBigQueryClient()
+    reports = [SESSION_DATA, AD_DATA]
+
+    assert run(reports, ga_client, bq_client, COMMUNITIES,
+               pipeline_options(tmp_path, '--end-date', '2024-02-10', '--no-cache')) == []
+    ga_client.ranges.clear()
+    assert run(reports, ga_client, bq_client, COMMUNITIES,
+               pipeline_options(tmp_path, '--end-date', '2024-02-15', '--no-cache')) == []
+
+    # Only the three look-back days and the five new ones are requested again
+    assert {(start_date, end_date) for _, start_date, end_date in ga_client.ranges} == {("2024-02-07", "2024-02-15")}
+    assert load_state(str(tmp_path / 'state.json'))[AD_DATA.name] == {"111": "2024-02-15", "222": "2024-02-15"}
+
+    # The refreshed days are replaced, not appended: the table matches a single run over the whole range
+    fresh_client = FakeBigQueryClient()
+    (tmp_path / 'fresh').mkdir()
+    run(reports, RecordingAnalyticsClient(), fresh_client, COMMUNITIES,
+        pipeline_options(tmp_path / 'fresh', '--end-date', '2024-02-15', '--no-cache'))
+    for report in reports:
+        keys = row_keys(bq_client, report)
+        assert len(keys) == len(set(keys))
+        assert sorted(keys) == sorted(row_keys(fresh_client, report))
+
+
+def test_failed_shard_is_loaded_by_resume(tmp_path):
+    bq_client = FakeBigQueryClient()
+    reports = [SESSION_DATA, AD_DATA]
+    options = pipeline_options(tmp_path, '--end-date', '2024-03-10')
+
+    failed = run(reports, RecordingAnalyticsClient(failing_properties={"222"}), bq_client, COMMUNITIES, options)
+    assert failed and {unit.property_id for unit in failed} == {"222"}
+    assert RunJournal.load(str(tmp_path / 'journal.json')).unfinished()
+    assert "222" not in load_state(str(tmp_path / 'state.json'))[SESSION_DATA.name]
+    loaded_before = {report.name: len(row_keys(bq_client, report)) for report in reports}
+
+    # The resumed run requests only the failed property's shards, over the original range
+    ga_client = RecordingAnalyticsClient()
+    assert run(reports, ga_client, bq_client, COMMUNITIES, pipeline_options(tmp_path, '--resume')) == []
+    assert {property_id for property_id, _, _ in ga_client.ranges} == {"222"}
+    assert not RunJournal.load(str(tmp_path / 'journal.json')).unfinished()
+    assert load_state(str(tmp_path / 'state.json'))[SESSION_DATA.name] == {"111": "2024-03-10", "222": "2024-03-10"}
+
+    for report in reports:
+        keys = row_keys(bq_client, report)
+        assert len(keys) == len(set(keys)) == 2 * loaded_before[report.name]
+
+    # The rollups cover the resumed property's rows too
+    monthly = bq_client.fetch_rows(f"{DATASET_ID}.SessionAdData_monthly")
+    assert {(row["period_start"], row["Community_ID"]) for row in monthly} == {
+        (period_start, property_id) for period_start in ("2024-01-01", "2024-02-01", "2024-03-01")
+        for property_id in ("111", "222")}
+
+
+def test_legacy_table_is_migrated_to_a_partitioned_table(tmp_path):
+    bq_client = FakeBigQueryClient()
+    table_id = SESSION_DATA.table_id(DATASET_ID)
+    bq_client.create_dataset(bigquery.Dataset(DATASET_ID))
+
+    # The table load_table_from_dataframe created before partitioning: Date typed DATETIME, no layout
+    bq_client.create_table(bigquery.Table(table_id, schema=[
+        bigquery.SchemaField("Date", "DATETIME"),
+        bigquery.SchemaField("newUsers", "INTEGER"),
+        bigquery.SchemaField("engagedSessions", "INTEGER"),
+        bigquery.SchemaField("Community_ID", "STRING"),
+    ]))
+    bq_client.conn.execute(f'INSERT INTO "{table_id}" VALUES (?, ?, ?, ?)', ("2023-12-30 00:00:00", 5, 3, "111"))
+
+    assert run([SESSION_DATA], RecordingAnalyticsClient(), bq_client, COMMUNITIES,
+               pipeline_options(tmp_path, '--end-date', '2024-01-31', '--no-cache')) == []
+
+    table = bq_client.get_table(table_id)
+    assert table.time_partitioning.type_ == bigquery.TimePartitioningType.DAY
+    assert table.time_partitioning.field == SESSION_DATA.date_column
+    assert table.clustering_fields == list(SESSION_DATA.cluster_columns)
+    assert f"{table_id}_migration" not in bq_client.schemas
+
+    # The legacy row survives with its Date cast to a DATE, next to the newly fetched days
+    rows = bq_client.fetch_rows(table_id)
+    assert {"Date": "2023-12-30", "newUsers": 5, "engagedSessions": 3, "Community_ID": "111"} in rows
+    assert len(rows) == 1 + 2 * 31
+
+
+def test_every_report_definition_has_a_column_for_each_field():
+    for report in REPORTS.values():
+        columns = {name for name, _ in report.schema}
+        assert {report.column_for(name) for name in report.dimensions + report.metrics} <= columns